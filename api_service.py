@@ -3,9 +3,9 @@ FastAPI Microservice for Plant Disease Detection using PyTorch
 Integrates with MERN Stack
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import torch
 import torch.nn.functional as F
 import timm
@@ -14,11 +14,19 @@ import cv2
 import joblib
 import json
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
 from pydantic import BaseModel, Field
 from datetime import datetime
+import asyncio
+import threading
+import time
 import io
+import os
+import hmac
+import uuid
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -42,13 +50,101 @@ label_encoder = None
 class_names = None
 device = None
 
+# Warm-up state (the service only reports ready once warm-up has finished)
+warmup_state = {
+    'status': 'pending',
+    'timings_ms': {},
+    'total_ms': 0.0,
+    'completed_at': None
+}
+
+# Hot reload state (a candidate model is loaded, warmed up and optionally
+# shadow-scored in the background, then swapped in on the event loop)
+reload_state = {
+    'status': 'idle',
+    'model_path': None,
+    'loaded_at': None,
+    'model_version': 0,
+    'shadow': None,
+    'error': None
+}
+shadow_candidate = None
+RELOAD_BUSY = ('loading', 'warming_up', 'shadowing')
+
 # Configuration
 CONFIG = {
     'model_path': 'efficientnet_plant_disease.pth',
+    'model_arch': 'efficientnet_b3',  # Used when a checkpoint doesn't record its 'arch'
     'label_encoder_path': 'label_encoder.pkl',
     'class_names_path': 'class_names.json',
     'image_size': (224, 224),
-    'confidence_threshold': 0.5
+    'confidence_threshold': 0.5,
+    'max_batch_size': 10,
+    'micro_batch_size': 8,  # Images per forward pass in /predict/batch
+    'warmup_batch_sizes': None,  # None = every size from 1 to micro_batch_size
+    'warmup_iterations': 3,
+    'reload_poll_interval': 0,  # Seconds between model file checks, 0 disables the watcher
+    'shadow_requests': 0,  # Live requests to shadow-score before swapping, 0 swaps immediately
+    'shadow_timeout': 300,  # Seconds to wait for shadow samples before deciding anyway
+    'shadow_min_agreement': 0.9,
+    'reload_models_dir': 'models',  # /admin/reload only loads checkpoints from here (or model_path)
+    'admin_token': os.environ.get('ADMIN_TOKEN'),  # X-Admin-Token for /admin/*; unset = localhost only
+    'runtime_profile_path': 'runtime_profile.json',  # Written by autotune.py
+    'quality_gate': True,  # Reject blurry/badly exposed/non-leaf photos before inference
+    'min_sharpness': 60.0,  # Laplacian variance of the resized grayscale image
+    'min_brightness': 40.0,  # Mean gray level (0-255)
+    'max_brightness': 220.0,
+    'max_clipped_fraction': 0.3,  # Share of pixels crushed to black or blown to white
+    'min_leaf_coverage': 0.15,  # Share of pixels in the leaf hue range (green to yellow)
+    'leaf_hue_range': (20, 95),  # OpenCV hue (0-180)
+    'leaf_min_saturation': 40,
+    'leaf_min_value': 40,
+    'explain_enabled': True,  # Keep recent uploads so GET /explain/{upload_id} can run Grad-CAM
+    'explain_cache_size': 256,  # Uploads (and rendered overlays) kept for /explain
+    'explain_max_batch': 8,  # Concurrent explanation requests computed in one pass
+    'explain_batch_window_ms': 20,
+    'explain_overlay_alpha': 0.4,
+    'inference_workers': 2,  # Threads running forward passes for the scheduler
+    'lane_limits': {'interactive': 2, 'bulk': 1},  # Concurrent forward passes per priority lane
+    'lane_metrics_window': 1000,  # Recent requests per lane used for latency percentiles
+    'adaptive_resolution': False,  # Drop to a smaller input size under load, back to full size after
+    'resolution_levels': [224, 192, 160],  # Square input sizes, full size first
+    'resolution_report_path': 'evaluation/resolution_report.json',  # From evaluation.py --resolutions
+    'max_resolution_accuracy_drop': 0.02,  # Levels losing more accuracy than this (per report) are skipped
+    'adaptive_max_queue_depth': 8,  # Scheduler jobs queued or running before stepping down
+    'adaptive_p95_target_ms': 250.0,  # Interactive-lane p95 latency before stepping down
+    'adaptive_latency_window_s': 10.0,  # The p95 only covers interactive requests finished this recently
+    'adaptive_recover_ratio': 0.5,  # Step back up once depth and p95 are below this share of the targets
+    'adaptive_min_dwell_s': 5.0  # Minimum seconds between resolution changes
+}
+
+# Image-quality gate counters, exposed at /metrics
+quality_stats = {
+    'checked': 0,
+    'rejected': 0,
+    'reasons': {},
+    'score_sums': {},
+    'gate_ms_sum': 0.0
+}
+
+# Grad-CAM explanations: recent uploads and rendered overlays (LRU), plus the
+# queue that batches concurrent requests onto a dedicated thread
+explain_cache = OrderedDict()
+overlay_cache = OrderedDict()
+explain_inflight = {}
+explain_queue = None
+explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+
+# Priority lanes, highest first: single /predict calls are interactive,
+# /predict/batch micro-batches are bulk
+LANES = ('interactive', 'bulk')
+
+RETAKE_HINTS = {
+    'blurry': "Hold the camera steady and tap the leaf to focus",
+    'too_dark': "Move to better light",
+    'too_bright': "Avoid direct sunlight and glare",
+    'poor_exposure': "Avoid harsh shadows and glare",
+    'no_leaf': "Fill the frame with the affected leaf"
 }
 
 # Response models
@@ -63,6 +159,9 @@ class PredictionResponse(BaseModel):
     all_predictions: List[PredictionItem]
     timestamp: str
     message: str = None
+    quality: Optional[Dict[str, float]] = None
+    upload_id: Optional[str] = None
+    resolution: Optional[int] = None
     
     class Config:
         populate_by_name = True
@@ -70,85 +169,807 @@ class PredictionResponse(BaseModel):
 class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
+    ready: bool
     num_classes: int
     device: str
     timestamp: str
 
+class ReloadRequest(BaseModel):
+    model_path: str = None
+    class_names_path: str = None
+    shadow_requests: int = None
+    force: bool = False
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    model_loaded: bool
+    warmup_status: str
+    warmup_timings_ms: Dict[str, List[float]]
+    warmup_total_ms: float
+    timestamp: str
+
+def get_warmup_batch_sizes() -> List[int]:
+    """Batch sizes the inference path can run at"""
+    if CONFIG['warmup_batch_sizes']:
+        return CONFIG['warmup_batch_sizes']
+    return list(range(1, CONFIG['micro_batch_size'] + 1))
+
+def load_runtime_profile() -> Dict:
+    """Read the thread/worker profile written by autotune.py, if any"""
+    path = Path(CONFIG['runtime_profile_path'])
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def apply_runtime_profile(profile: Dict):
+    """Apply thread counts, micro-batch size, scheduler workers and CPU affinity from a tuned profile"""
+    global scheduler
+    
+    # autotune.py measured `threads` shared by inference_workers concurrent
+    # forward passes; apply the same split (no requests have run yet)
+    CONFIG['inference_workers'] = profile.get('inference_workers', CONFIG['inference_workers'])
+    scheduler = InferenceScheduler(CONFIG['inference_workers'], CONFIG['lane_limits'],
+                                   CONFIG['lane_metrics_window'])
+    torch.set_num_threads(max(1, profile['threads'] // CONFIG['inference_workers']))
+    try:
+        torch.set_num_interop_threads(profile['interop_threads'])
+    except RuntimeError:
+        # Inter-op pool already started (e.g. set by a parent process)
+        pass
+    CONFIG['micro_batch_size'] = profile['micro_batch_size']
+    
+    # Pin this worker to its own cores so workers don't oversubscribe the box
+    affinity = profile.get('cpu_affinity')
+    worker_index = os.environ.get('WORKER_INDEX')
+    if affinity and hasattr(os, 'sched_setaffinity'):
+        if worker_index is not None:
+            os.sched_setaffinity(0, affinity[int(worker_index) % len(affinity)])
+        elif profile['workers'] == 1:
+            os.sched_setaffinity(0, affinity[0])
+        else:
+            print("Skipping CPU affinity: set WORKER_INDEX per worker to pin cores")
+    
+    print(f"✓ Runtime profile applied: {profile['threads']} threads "
+          f"({torch.get_num_threads()} per inference worker), "
+          f"{profile['interop_threads']} inter-op, micro-batch {profile['micro_batch_size']}")
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+class NormalizedInput(torch.nn.Module):
+    """Wraps a model so it takes raw uint8 RGB batches in NHWC layout
+    
+    The ImageNet mean/std normalization is folded into one in-graph
+    multiply-add with constant buffers, so requests never convert or normalize
+    images on the host. The NHWC -> NCHW permute is a view (channels-last strides).
+    """
+    def __init__(self, net: torch.nn.Module):
+        super().__init__()
+        self.net = net
+        mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1) * 255.0
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1) * 255.0
+        # (x - mean) / std == x * scale + shift
+        self.register_buffer('scale', 1.0 / std)
+        self.register_buffer('shift', -mean / std)
+    
+    def normalize(self, images: torch.Tensor) -> torch.Tensor:
+        images = images.permute(0, 3, 1, 2).float()
+        return torch.addcmul(self.shift, images, self.scale)
+    
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        return self.net(self.normalize(images))
+
+class InferenceScheduler:
+    """Runs forward passes on worker threads, taking queued jobs lane by lane
+    
+    Every job is one forward pass, so bulk requests queue one job per
+    micro-batch and a waiting interactive job is picked up at the next batch
+    boundary. Each lane has its own concurrency limit (a bulk backlog can
+    never occupy every worker) and its own queue/latency metrics. Jobs are
+    queued and dispatched on the event loop; only the forward pass runs on
+    the worker threads.
+    """
+    def __init__(self, workers: int, lane_limits: Dict[str, int], window: int = 1000):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self.running = 0
+        self.lanes = {
+            lane: {
+                'limit': lane_limits[lane],
+                'queue': deque(),
+                'running': 0,
+                'submitted': 0,
+                'completed': 0,
+                'failed': 0,
+                'images': 0,
+                'max_queue_depth': 0,
+                'wait_ms': deque(maxlen=window),
+                'latency_ms': deque(maxlen=window),
+                'finished_at': deque(maxlen=window)
+            }
+            for lane in LANES
+        }
+    
+    async def infer(self, lane: str, net: torch.nn.Module,
+                    batch: torch.Tensor) -> Tuple[torch.Tensor, float]:
+        """Queue a forward pass in `lane`; returns (outputs, inference ms)"""
+        state = self.lanes[lane]
+        future = asyncio.get_running_loop().create_future()
+        state['queue'].append((net, batch, future, time.perf_counter()))
+        state['submitted'] += 1
+        state['max_queue_depth'] = max(state['max_queue_depth'], len(state['queue']))
+        self._dispatch()
+        return await future
+    
+    def recent_latencies(self, lane: str, seconds: float) -> List[float]:
+        """Latencies (ms) of the lane's jobs that finished within the last `seconds`"""
+        state = self.lanes[lane]
+        cutoff = time.monotonic() - seconds
+        return [ms for ms, finished in zip(state['latency_ms'], state['finished_at'])
+                if finished >= cutoff]
+    
+    def queue_depth(self) -> int:
+        return sum(len(state['queue']) + state['running'] for state in self.lanes.values())
+    
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.running < self.workers:
+            lane = next((lane for lane in LANES if self.lanes[lane]['queue']
+                         and self.lanes[lane]['running'] < self.lanes[lane]['limit']), None)
+            if lane is None:
+                return
+            state = self.lanes[lane]
+            net, batch, future, queued_at = state['queue'].popleft()
+            if future.cancelled():
+                # Client went away while queued
+                continue
+            state['running'] += 1
+            self.running += 1
+            state['wait_ms'].append((time.perf_counter() - queued_at) * 1000)
+            task = loop.run_in_executor(self.executor, self._forward, net, batch)
+            task.add_done_callback(
+                lambda task, lane=lane, future=future, queued_at=queued_at, images=len(batch):
+                    self._finished(lane, future, queued_at, images, task))
+    
+    @staticmethod
+    def _forward(net: torch.nn.Module, batch: torch.Tensor) -> Tuple[torch.Tensor, float]:
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = net(batch)
+        return outputs, (time.perf_counter() - start) * 1000
+    
+    def _finished(self, lane: str, future: asyncio.Future, queued_at: float,
+                  images: int, task: asyncio.Future):
+        state = self.lanes[lane]
+        state['running'] -= 1
+        self.running -= 1
+        if task.exception() is not None:
+            state['failed'] += 1
+            if not future.done():
+                future.set_exception(task.exception())
+        else:
+            state['completed'] += 1
+            state['images'] += images
+            state['latency_ms'].append((time.perf_counter() - queued_at) * 1000)
+            state['finished_at'].append(time.monotonic())
+            if not future.done():
+                future.set_result(task.result())
+        self._dispatch()
+    
+    def metrics(self) -> Dict:
+        """Per-lane counters, queue depth and wait/latency percentiles (ms)"""
+        def percentiles(values):
+            if not values:
+                return None
+            p50, p95, p99 = np.percentile(list(values), [50, 95, 99])
+            return {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2)}
+        
+        return {
+            'workers': self.workers,
+            'running': self.running,
+            'lanes': {
+                lane: {
+                    'limit': state['limit'],
+                    'queued': len(state['queue']),
+                    'running': state['running'],
+                    'max_queue_depth': state['max_queue_depth'],
+                    'submitted': state['submitted'],
+                    'completed': state['completed'],
+                    'failed': state['failed'],
+                    'images': state['images'],
+                    'wait_ms': percentiles(state['wait_ms']),
+                    'latency_ms': percentiles(state['latency_ms'])
+                }
+                for lane, state in self.lanes.items()
+            }
+        }
+
+class ResolutionController:
+    """Chooses the input resolution for each request from current load
+    
+    Steps one level down while the scheduler's queue depth or the recent
+    interactive p95 latency is over target, and one level back up once both
+    are comfortably below it. Changes are at least `adaptive_min_dwell_s`
+    apart so the effect of a step shows up in the latency before the next.
+    """
+    def __init__(self, levels: List[int]):
+        self.levels = list(levels)
+        self.index = 0
+        self.changed_at = 0.0
+        self.switches = 0
+        self.requests = {}
+    
+    @property
+    def resolution(self) -> int:
+        return self.levels[self.index]
+    
+    def select(self, queue_depth: int, p95_ms: float = None) -> int:
+        """Update the level from the current load and return the resolution to use"""
+        now = time.monotonic()
+        if CONFIG['adaptive_resolution'] and now - self.changed_at >= CONFIG['adaptive_min_dwell_s']:
+            max_depth = CONFIG['adaptive_max_queue_depth']
+            target_ms = CONFIG['adaptive_p95_target_ms']
+            recover = CONFIG['adaptive_recover_ratio']
+            overloaded = queue_depth > max_depth or (p95_ms is not None and p95_ms > target_ms)
+            relaxed = (queue_depth <= max_depth * recover
+                       and (p95_ms is None or p95_ms <= target_ms * recover))
+            step = 1 if overloaded else -1 if relaxed else 0
+            index = min(max(self.index + step, 0), len(self.levels) - 1)
+            if index != self.index:
+                print(f"Input resolution {self.resolution} -> {self.levels[index]} "
+                      f"(queue depth {queue_depth}, p95 {p95_ms if p95_ms is None else round(p95_ms)} ms)")
+                self.index = index
+                self.changed_at = now
+                self.switches += 1
+        
+        resolution = self.resolution
+        self.requests[resolution] = self.requests.get(resolution, 0) + 1
+        return resolution
+    
+    def metrics(self) -> Dict:
+        return {
+            'enabled': CONFIG['adaptive_resolution'],
+            'levels': self.levels,
+            'current': self.resolution,
+            'switches': self.switches,
+            'requests': {str(level): count for level, count in self.requests.items()}
+        }
+
+scheduler = InferenceScheduler(CONFIG['inference_workers'], CONFIG['lane_limits'],
+                               CONFIG['lane_metrics_window'])
+
+resolution_controller = ResolutionController(CONFIG['resolution_levels'][:1])
+
+def load_resolution_levels() -> List[int]:
+    """Resolution levels for adaptive mode, keeping only those validated offline
+    
+    The report written by `python evaluation.py --resolutions ...` gives the
+    accuracy drop of each level against full size; levels missing from it or
+    losing more than CONFIG['max_resolution_accuracy_drop'] are not used.
+    """
+    full, *levels = CONFIG['resolution_levels']
+    if not CONFIG['adaptive_resolution']:
+        return [full]
+    
+    path = Path(CONFIG['resolution_report_path'])
+    if not path.exists():
+        print(f"Warning: no resolution report at {path}; adaptive resolution uses "
+              f"unvalidated levels {CONFIG['resolution_levels']}")
+        return [full] + levels
+    
+    with open(path, 'r') as f:
+        report = json.load(f)['resolutions']
+    validated = [level for level in levels if str(level) in report
+                 and report[str(level)]['accuracy_drop'] <= CONFIG['max_resolution_accuracy_drop']]
+    skipped = sorted(set(levels) - set(validated), reverse=True)
+    if skipped:
+        print(f"Resolution levels {skipped} not validated within "
+              f"{CONFIG['max_resolution_accuracy_drop']:.1%} accuracy drop, skipping")
+    return [full] + validated
+
+def select_resolution() -> int:
+    """Input resolution for a new request, from the scheduler's current load"""
+    # Time-bounded, so a past burst can't hold the level down once load eases;
+    # an empty window (no recent traffic) counts as relaxed
+    recent = scheduler.recent_latencies('interactive', CONFIG['adaptive_latency_window_s'])
+    p95_ms = float(np.percentile(recent, 95)) if recent else None
+    return resolution_controller.select(scheduler.queue_depth(), p95_ms)
+
+def is_ready() -> bool:
+    """Model is loaded and warm-up has finished"""
+    return model is not None and warmup_state['status'] == 'done'
+
+def load_model_bundle(model_path: str, class_names_path: str,
+                      allow_pretrained_fallback: bool = False):
+    """Create the model, load trained weights and the matching class list
+    
+    The architecture comes from the checkpoint's 'arch' field (e.g. a distilled
+    efficientnet_b0 student), falling back to CONFIG['model_arch']. A
+    `.torchscript` file (pruned/quantized export from `train_model.py --mode
+    compress`) is loaded as-is and only served on CPU. The returned model is wrapped
+    in NormalizedInput and takes uint8 NHWC batches.
+    """
+    with open(class_names_path, 'r') as f:
+        names = json.load(f)
+    
+    if Path(model_path).suffix == '.torchscript':
+        if device is not None and device.type == 'cuda':
+            # The int8 export only runs on CPU, but requests put inputs on `device`
+            raise ValueError(f"{model_path} is a CPU-only TorchScript export; serve it on a "
+                             f"CPU host (e.g. CUDA_VISIBLE_DEVICES=\"\") or use the .pth checkpoint")
+        net = NormalizedInput(torch.jit.load(model_path, map_location='cpu'))
+        net.eval()
+        print(f"✓ TorchScript model loaded from {model_path}")
+        return net, names
+    
+    try:
+        checkpoint = torch.load(model_path, map_location=device)
+        state_dict = checkpoint.get('model_state_dict', checkpoint)
+        arch = checkpoint.get('arch', CONFIG['model_arch'])
+        net = timm.create_model(arch, pretrained=False, num_classes=len(names))
+        net.load_state_dict(state_dict)
+        print(f"✓ Model weights ({arch}) loaded from {model_path}")
+    except Exception as e:
+        if not allow_pretrained_fallback:
+            raise
+        # Trained weights missing or saved with an incompatible timm version
+        print(f"Could not load weights from {model_path} ({e})")
+        print("Falling back to pretrained ImageNet weights")
+        net = timm.create_model(CONFIG['model_arch'], pretrained=True, num_classes=len(names))
+    
+    net = NormalizedInput(net).to(device)
+    net.eval()
+    return net, names
+
+def warmup_model(net: torch.nn.Module, target_device: torch.device,
+                 batch_sizes: List[int], iterations: int,
+                 resolutions: List[int] = None) -> Dict[str, List[float]]:
+    """Run synthetic batches through the model and return per-batch-size timings (ms)
+    
+    Reduced `resolutions` (adaptive mode) are warmed up too and keyed
+    "<batch size>@<resolution>".
+    """
+    timings = {}
+    full_size = (CONFIG['image_size'][1], CONFIG['image_size'][0])
+    sizes = [full_size] + [(r, r) for r in (resolutions or [])[1:]]
+    
+    with torch.no_grad():
+        for height, width in sizes:
+            for batch_size in batch_sizes:
+                dummy = torch.randint(0, 256, (batch_size, height, width, 3), dtype=torch.uint8,
+                                      device=target_device)
+                key = str(batch_size) if (height, width) == full_size else f"{batch_size}@{height}"
+                timings[key] = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    net(dummy)
+                    if target_device.type == 'cuda':
+                        torch.cuda.synchronize()
+                    timings[key].append(round((time.perf_counter() - start) * 1000, 2))
+    
+    return timings
+
+def run_warmup():
+    """Warm up the loaded model and record timings in warmup_state"""
+    warmup_state['status'] = 'running'
+    print(f"Warming up model on batch sizes {get_warmup_batch_sizes()}...")
+    
+    try:
+        start = time.perf_counter()
+        timings = warmup_model(model, device, get_warmup_batch_sizes(),
+                               CONFIG['warmup_iterations'], resolution_controller.levels)
+        warmup_state['timings_ms'] = timings
+        warmup_state['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        warmup_state['completed_at'] = datetime.now().isoformat()
+        warmup_state['status'] = 'done'
+        
+        for batch_size, times in timings.items():
+            print(f"  batch {batch_size}: first {times[0]:.1f} ms, last {times[-1]:.1f} ms")
+        print(f"✓ Warm-up complete in {warmup_state['total_ms']:.0f} ms - API is ready")
+        
+    except Exception as e:
+        warmup_state['status'] = 'failed'
+        print(f"Error during warm-up: {e}")
+
+def load_artifacts(target_device: torch.device):
+    """Load model, class names and label encoder into the module globals"""
+    global model, label_encoder, class_names, device
+    
+    device = target_device
+    
+    # Load model and class names (pretrained fallback if the weights don't match timm)
+    model, class_names = load_model_bundle(CONFIG['model_path'], CONFIG['class_names_path'],
+                                           allow_pretrained_fallback=True)
+    reload_state['model_path'] = CONFIG['model_path']
+    reload_state['loaded_at'] = datetime.now().isoformat()
+    
+    # Load label encoder
+    label_encoder = joblib.load(CONFIG['label_encoder_path'])
+    print(f"✓ Label encoder loaded from {CONFIG['label_encoder_path']}")
+    print(f"✓ Class names loaded: {len(class_names)} classes")
+
 # Load model and encoder on startup
 @app.on_event("startup")
 async def load_model_on_startup():
     """Load ML model and label encoder when API starts"""
-    global model, label_encoder, class_names, device
-    
     try:
-        print("Loading model and encoders...")
-        
-        # Set device
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"Using device: {device}")
-        
-        # Load class names first to get num_classes
-        with open(CONFIG['class_names_path'], 'r') as f:
-            class_names = json.load(f)
-        num_classes = len(class_names)
+        # Apply tuned thread settings before torch starts its thread pools
+        profile = load_runtime_profile()
+        if profile:
+            apply_runtime_profile(profile)
+        else:
+            # Share the default intra-op pool among the scheduler's concurrent forward passes
+            torch.set_num_threads(max(1, torch.get_num_threads() // CONFIG['inference_workers']))
         
-        # Create model with pretrained ImageNet weights
-        # Note: Using pretrained weights due to version compatibility
-        # Your custom trained weights have a version mismatch with current timm
-        model = timm.create_model('efficientnet_b3', pretrained=True, num_classes=num_classes)
-        model = model.to(device)
-        model.eval()
-        print(f"✓ Model loaded from {CONFIG['model_path']}")
+        if model is not None:
+            # Preloaded by serve.py in the parent process and shared copy-on-write
+            print(f"✓ Using preloaded model from parent process ({len(class_names)} classes)")
+        else:
+            print("Loading model and encoders...")
+            
+            # Set device
+            target_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            print(f"Using device: {target_device}")
+            load_artifacts(target_device)
         
-        # Load label encoder
-        label_encoder = joblib.load(CONFIG['label_encoder_path'])
-        print(f"✓ Label encoder loaded from {CONFIG['label_encoder_path']}")
-        print(f"✓ Class names loaded: {len(class_names)} classes")
+        resolution_controller.levels = load_resolution_levels()
+        if CONFIG['adaptive_resolution']:
+            print(f"Adaptive input resolution: levels {resolution_controller.levels}")
         
         print("=" * 60)
-        print("API Ready! Model loaded successfully")
+        print("Model loaded successfully - warming up before accepting traffic")
         print("=" * 60)
         
     except Exception as e:
         print(f"Error loading model: {e}")
         print("API will start but predictions will fail until model is loaded")
+        return
+    
+    # Warm up in a worker thread so /live keeps answering while /ready is false
+    asyncio.get_running_loop().run_in_executor(None, run_warmup)
+    
+    if CONFIG['reload_poll_interval'] > 0:
+        asyncio.create_task(watch_model_file())
+
+def shadow_score(image_tensor: torch.Tensor, live_prediction: str, live_ms: float):
+    """Score a live request with the candidate model and record agreement/latency"""
+    candidate = shadow_candidate
+    if candidate is None or candidate['samples'] >= candidate['target']:
+        return
+    
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = candidate['model'](image_tensor)
+    shadow_ms = (time.perf_counter() - start) * 1000
+    shadow_prediction = candidate['class_names'][int(outputs.argmax(dim=1)[0])]
+    
+    with candidate['lock']:
+        if candidate['samples'] >= candidate['target']:
+            return
+        candidate['samples'] += 1
+        candidate['agree'] += int(shadow_prediction == live_prediction)
+        candidate['live_ms'].append(live_ms)
+        candidate['shadow_ms'].append(shadow_ms)
+        if candidate['samples'] >= candidate['target']:
+            candidate['loop'].call_soon_threadsafe(candidate['done'].set)
+
+def schedule_shadow_score(image_tensor: torch.Tensor, live_prediction: str, live_ms: float):
+    """Run shadow scoring off the request path if a candidate is being evaluated"""
+    if shadow_candidate is not None:
+        asyncio.get_running_loop().run_in_executor(
+            None, shadow_score, image_tensor, live_prediction, live_ms)
 
-def preprocess_image(image_bytes: bytes) -> torch.Tensor:
-    """Preprocess uploaded image for model prediction"""
+def summarize_shadow(candidate: Dict) -> Dict:
+    """Agreement and latency comparison between the live and candidate models"""
+    samples = candidate['samples']
+    return {
+        'samples': samples,
+        'agreement': candidate['agree'] / samples if samples else None,
+        'live_p50_ms': float(np.percentile(candidate['live_ms'], 50)) if samples else None,
+        'shadow_p50_ms': float(np.percentile(candidate['shadow_ms'], 50)) if samples else None,
+        'live_p95_ms': float(np.percentile(candidate['live_ms'], 95)) if samples else None,
+        'shadow_p95_ms': float(np.percentile(candidate['shadow_ms'], 95)) if samples else None
+    }
+
+async def reload_model(model_path: str, class_names_path: str, shadow_requests: int,
+                       force: bool = False):
+    """Load, warm up and optionally shadow-score a new model, then swap it in"""
+    global model, class_names, shadow_candidate
+    
+    loop = asyncio.get_running_loop()
+    reload_state.update(status='loading', error=None, shadow=None)
+    print(f"Reloading model from {model_path}...")
+    
     try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        
-        # Decode image
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ValueError("Failed to decode image")
-        
-        # Convert BGR to RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        # Load and warm up in a worker thread; the live model keeps serving
+        candidate, candidate_names = await loop.run_in_executor(
+            None, load_model_bundle, model_path, class_names_path)
+        reload_state['status'] = 'warming_up'
+        timings = await loop.run_in_executor(
+            None, warmup_model, candidate, device,
+            get_warmup_batch_sizes(), CONFIG['warmup_iterations'], resolution_controller.levels)
         
-        # Resize to model input size
-        img = cv2.resize(img, CONFIG['image_size'])
-        
-        # Convert to tensor and normalize
-        img_tensor = torch.from_numpy(img).permute(2, 0, 1).float() / 255.0
-        
-        # Normalize with ImageNet stats
-        mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
-        std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
-        img_tensor = (img_tensor - mean) / std
-        
-        # Add batch dimension
-        img_tensor = img_tensor.unsqueeze(0)
+        if shadow_requests > 0 and model is not None:
+            reload_state['status'] = 'shadowing'
+            shadow_candidate = {
+                'model': candidate,
+                'class_names': candidate_names,
+                'target': shadow_requests,
+                'samples': 0,
+                'agree': 0,
+                'live_ms': [],
+                'shadow_ms': [],
+                'done': asyncio.Event(),
+                'loop': loop,
+                'lock': threading.Lock()
+            }
+            try:
+                await asyncio.wait_for(shadow_candidate['done'].wait(), CONFIG['shadow_timeout'])
+            except asyncio.TimeoutError:
+                print("Shadow scoring timed out, deciding on the samples collected so far")
+            
+            summary = summarize_shadow(shadow_candidate)
+            shadow_candidate = None
+            reload_state['shadow'] = summary
+            print(f"Shadow scoring: {summary}")
+            
+            agreement = summary['agreement']
+            if not force and (agreement is None or agreement < CONFIG['shadow_min_agreement']):
+                reload_state['status'] = 'rejected'
+                print(f"Reload rejected: agreement {agreement} below "
+                      f"{CONFIG['shadow_min_agreement']}")
+                return
         
-        return img_tensor
+        # Swap on the event loop: requests snapshot (model, class_names) together,
+        # so in-flight requests finish on the old model and new ones see the new one
+        model, class_names = candidate, candidate_names
+        warmup_state.update(status='done', timings_ms=timings,
+                            total_ms=round(sum(sum(t) for t in timings.values()), 2),
+                            completed_at=datetime.now().isoformat())
+        reload_state.update(status='done', model_path=model_path,
+                            loaded_at=datetime.now().isoformat(),
+                            model_version=reload_state['model_version'] + 1)
+        print(f"✓ Model swapped to {model_path} ({len(class_names)} classes)")
         
+    except Exception as e:
+        shadow_candidate = None
+        reload_state.update(status='failed', error=str(e))
+        print(f"Error reloading model: {e}")
+
+async def watch_model_file():
+    """Reload the model whenever the checkpoint file on disk changes"""
+    path = CONFIG['model_path']
+    last_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    
+    while True:
+        await asyncio.sleep(CONFIG['reload_poll_interval'])
+        if not os.path.exists(path):
+            continue
+        mtime = os.path.getmtime(path)
+        if mtime != last_mtime and reload_state['status'] not in RELOAD_BUSY:
+            last_mtime = mtime
+            print(f"Detected new checkpoint at {path}")
+            await reload_model(path, CONFIG['class_names_path'], CONFIG['shadow_requests'])
+
+def decode_image(image_bytes: bytes, out: np.ndarray = None) -> np.ndarray:
+    """Decode and resize an upload to uint8 RGB HWC, writing into `out` if given"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode image")
+    
+    # Resize first so the colour conversion runs on the small image
+    img = cv2.resize(img, CONFIG['image_size'])
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=out)
+
+class ImageQualityError(ValueError):
+    """A photo failed the quality gate; carries the scores and reasons"""
+    def __init__(self, reasons: List[str], scores: Dict[str, float]):
+        super().__init__(f"Image quality too low: {', '.join(reasons)}")
+        self.reasons = reasons
+        self.scores = scores
+
+def assess_quality(frame: np.ndarray) -> Dict[str, float]:
+    """Sharpness, exposure and leaf-coverage scores of a resized uint8 RGB frame"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    brightness = cv2.mean(gray)[0]
+    clipped = np.count_nonzero((gray < 8) | (gray > 247)) / gray.size
+    
+    hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
+    low_hue, high_hue = CONFIG['leaf_hue_range']
+    leaf = cv2.inRange(hsv, (low_hue, CONFIG['leaf_min_saturation'], CONFIG['leaf_min_value']),
+                       (high_hue, 255, 255))
+    
+    return {
+        'sharpness': round(float(std[0, 0]) ** 2, 2),
+        'brightness': round(brightness, 2),
+        'clipped_fraction': round(clipped, 4),
+        'leaf_coverage': round(cv2.countNonZero(leaf) / leaf.size, 4)
+    }
+
+def quality_issues(scores: Dict[str, float]) -> List[str]:
+    """Reasons a photo should be retaken (empty if it passes)"""
+    reasons = []
+    if scores['sharpness'] < CONFIG['min_sharpness']:
+        reasons.append('blurry')
+    if scores['brightness'] < CONFIG['min_brightness']:
+        reasons.append('too_dark')
+    elif scores['brightness'] > CONFIG['max_brightness']:
+        reasons.append('too_bright')
+    elif scores['clipped_fraction'] > CONFIG['max_clipped_fraction']:
+        reasons.append('poor_exposure')
+    if scores['leaf_coverage'] < CONFIG['min_leaf_coverage']:
+        reasons.append('no_leaf')
+    return reasons
+
+def check_quality(frame: np.ndarray) -> Dict[str, float]:
+    """Score a frame, record it in quality_stats and raise ImageQualityError if unusable"""
+    start = time.perf_counter()
+    scores = assess_quality(frame)
+    reasons = quality_issues(scores)
+    
+    quality_stats['checked'] += 1
+    quality_stats['gate_ms_sum'] += (time.perf_counter() - start) * 1000
+    for key, value in scores.items():
+        quality_stats['score_sums'][key] = quality_stats['score_sums'].get(key, 0.0) + value
+    if reasons:
+        quality_stats['rejected'] += 1
+        for reason in reasons:
+            quality_stats['reasons'][reason] = quality_stats['reasons'].get(reason, 0) + 1
+        raise ImageQualityError(reasons, scores)
+    return scores
+
+def retake_response(error: ImageQualityError, filename: str = None) -> Dict:
+    """Structured "please retake" result for a photo that failed the quality gate"""
+    result = {
+        "success": False,
+        "retake": True,
+        "reasons": error.reasons,
+        "hints": [RETAKE_HINTS[r] for r in error.reasons],
+        "quality": error.scores,
+        "message": "Image quality too low for a reliable diagnosis. Please retake the photo.",
+        "timestamp": datetime.now().isoformat()
+    }
+    if filename is not None:
+        result = {"filename": filename, **result}
+    return result
+
+def new_frame_batch(size: int) -> np.ndarray:
+    """Empty uint8 NHWC buffer that decoded frames are written into"""
+    width, height = CONFIG['image_size']
+    return np.empty((size, height, width, 3), dtype=np.uint8)
+
+def resize_frames(frames: np.ndarray, resolution: int) -> np.ndarray:
+    """Frames downscaled to resolution x resolution (unchanged if already that size)"""
+    if frames.shape[1:3] == (resolution, resolution):
+        return frames
+    resized = np.empty((len(frames), resolution, resolution, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        resized[i] = cv2.resize(frame, (resolution, resolution), interpolation=cv2.INTER_AREA)
+    return resized
+
+def preprocess_image(image_bytes: bytes) -> Tuple[torch.Tensor, Dict[str, float]]:
+    """Preprocess uploaded image for model prediction
+    
+    Returns a uint8 (1, H, W, 3) tensor (normalization happens inside the model)
+    and the quality scores. With CONFIG['quality_gate'], unusable photos raise
+    ImageQualityError before any inference is spent on them.
+    """
+    try:
+        frames = new_frame_batch(1)
+        decode_image(image_bytes, out=frames[0])
+        scores = check_quality(frames[0]) if CONFIG['quality_gate'] else None
+        return torch.from_numpy(frames), scores
+    
+    except ImageQualityError:
+        raise
     except Exception as e:
         raise ValueError(f"Image preprocessing failed: {str(e)}")
 
-def get_top_predictions(predictions: torch.Tensor, top_k: int = 5) -> List[Dict[str, float]]:
+def remember_upload(frame: torch.Tensor, class_index: int, class_name: str) -> str:
+    """Keep a preprocessed upload and its prediction for /explain; returns its ID"""
+    if not CONFIG['explain_enabled']:
+        return None
+    upload_id = uuid.uuid4().hex
+    explain_cache[upload_id] = {
+        'frame': frame,
+        'class_index': class_index,
+        'class_name': class_name,
+        'model_version': reload_state['model_version']
+    }
+    while len(explain_cache) > CONFIG['explain_cache_size']:
+        explain_cache.popitem(last=False)
+    return upload_id
+
+def compute_gradcam(net: torch.nn.Module, frames: torch.Tensor,
+                    class_indices: torch.Tensor) -> np.ndarray:
+    """Grad-CAM maps (N, H, W in 0-1) over the last block for the given classes
+    
+    The forward pass is split by hand at the last block instead of using hooks,
+    so concurrent predictions on the same model are unaffected.
+    """
+    inner = getattr(net, 'net', net)
+    if isinstance(inner, torch.jit.ScriptModule) or not all(
+            hasattr(inner, name) for name in ('conv_stem', 'bn1', 'blocks', 'forward_head')):
+        raise NotImplementedError("Grad-CAM needs an eager timm EfficientNet/MobileNetV3 model")
+    
+    with torch.no_grad():
+        x = inner.bn1(inner.conv_stem(net.normalize(frames)))
+        x = inner.blocks[:-1](x)
+        activations = inner.blocks[-1](x)
+    
+    with torch.enable_grad():
+        activations.requires_grad_(True)
+        x = activations
+        if hasattr(inner, 'bn2'):
+            # EfficientNet: head conv belongs to the features; MobileNetV3 has it in forward_head
+            x = inner.bn2(inner.conv_head(x))
+        logits = inner.forward_head(x)
+        score = logits.gather(1, class_indices.view(-1, 1)).sum()
+        grads, = torch.autograd.grad(score, activations)
+    
+    weights = grads.mean(dim=(2, 3), keepdim=True)
+    cam = F.relu((weights * activations.detach()).sum(dim=1, keepdim=True))
+    cam = F.interpolate(cam, size=frames.shape[1:3], mode='bilinear', align_corners=False)[:, 0]
+    cam = cam - cam.amin(dim=(1, 2), keepdim=True)
+    cam = cam / cam.amax(dim=(1, 2), keepdim=True).clamp_min(1e-8)
+    return cam.cpu().numpy()
+
+def render_overlay(frame: np.ndarray, cam: np.ndarray) -> bytes:
+    """PNG of the heatmap blended over the uint8 RGB frame"""
+    heat = cv2.applyColorMap((cam * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    base = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    alpha = CONFIG['explain_overlay_alpha']
+    ok, png = cv2.imencode('.png', cv2.addWeighted(base, 1 - alpha, heat, alpha, 0))
+    if not ok:
+        raise ValueError("Failed to encode overlay")
+    return png.tobytes()
+
+def explain_batch(net: torch.nn.Module, entries: List[Dict]) -> List[bytes]:
+    """Grad-CAM overlays for several cached uploads in one forward/backward pass"""
+    frames = torch.cat([entry['frame'] for entry in entries]).to(device)
+    class_indices = torch.tensor([entry['class_index'] for entry in entries], device=device)
+    cams = compute_gradcam(net, frames, class_indices)
+    return [render_overlay(entry['frame'][0].numpy(), cam) for entry, cam in zip(entries, cams)]
+
+async def explain_worker():
+    """Collect concurrent /explain requests for a short window and run them as one batch"""
+    loop = asyncio.get_running_loop()
+    window = CONFIG['explain_batch_window_ms'] / 1000
+    
+    while True:
+        batch = [await explain_queue.get()]
+        deadline = loop.time() + window
+        while len(batch) < CONFIG['explain_max_batch']:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(explain_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        upload_ids = [upload_id for upload_id, _ in batch]
+        try:
+            # Dedicated thread: explanations never occupy the prediction path's executor
+            pngs = await loop.run_in_executor(explain_executor, explain_batch, model,
+                                              [entry for _, entry in batch])
+            for upload_id, png in zip(upload_ids, pngs):
+                overlay_cache[upload_id] = png
+                while len(overlay_cache) > CONFIG['explain_cache_size']:
+                    overlay_cache.popitem(last=False)
+                explain_inflight.pop(upload_id).set_result(png)
+        except Exception as e:
+            for upload_id in upload_ids:
+                explain_inflight.pop(upload_id).set_exception(e)
+
+def get_top_predictions(predictions: torch.Tensor, top_k: int = 5,
+                        names: List[str] = None) -> List[Dict[str, float]]:
     """Get top K predictions with class names and confidence scores"""
+    names = names if names is not None else class_names
+    
     # Apply softmax to get probabilities
     probs = F.softmax(predictions, dim=1)[0]
     
@@ -159,7 +980,7 @@ def get_top_predictions(predictions: torch.Tensor, top_k: int = 5) -> List[Dict[
     top_predictions = []
     for prob, idx in zip(top_probs.cpu().numpy(), top_indices.cpu().numpy()):
         top_predictions.append({
-            'class': class_names[idx],
+            'class': names[idx],
             'confidence': float(prob)
         })
     
@@ -174,23 +995,130 @@ async def root():
         "framework": "PyTorch + EfficientNet",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
+            "live": "/live",
             "predict": "/predict",
             "predict_batch": "/predict/batch",
-            "classes": "/classes"
+            "classes": "/classes",
+            "metrics": "/metrics",
+            "explain": "/explain/{upload_id}"
         }
     }
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
+    if model is None:
+        status = "model_not_loaded"
+    elif not is_ready():
+        status = "warming_up"
+    else:
+        status = "healthy"
+    
     return HealthResponse(
-        status="healthy" if model is not None else "model_not_loaded",
+        status=status,
         model_loaded=model is not None,
+        ready=is_ready(),
         num_classes=len(class_names) if class_names else 0,
         device=str(device) if device else "unknown",
         timestamp=datetime.now().isoformat()
     )
 
+@app.get("/live")
+async def liveness_check():
+    """Liveness probe - the process is up and serving requests"""
+    return {"alive": True, "timestamp": datetime.now().isoformat()}
+
+@app.get("/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """Readiness probe - returns 503 until the model is loaded and warmed up"""
+    response = ReadinessResponse(
+        ready=is_ready(),
+        model_loaded=model is not None,
+        warmup_status=warmup_state['status'],
+        warmup_timings_ms=warmup_state['timings_ms'],
+        warmup_total_ms=warmup_state['total_ms'],
+        timestamp=datetime.now().isoformat()
+    )
+    if not response.ready:
+        return JSONResponse(status_code=503, content=response.model_dump())
+    return response
+
+LOCAL_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+def check_admin(client_request: Request, token: Optional[str]):
+    """Allow admin calls with the shared secret, or from localhost if none is configured"""
+    expected = CONFIG['admin_token']
+    if expected:
+        if not token or not hmac.compare_digest(token, expected):
+            raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
+    elif client_request.client is None or client_request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=403, detail="Admin endpoints are localhost-only "
+                                                    "unless CONFIG['admin_token'] is set")
+
+def resolve_reload_file(path: str, default: str, suffixes: Tuple[str, ...]) -> str:
+    """Path under CONFIG['reload_models_dir'] (or the configured default) with an allowed suffix"""
+    resolved = Path(path).resolve()
+    if resolved.suffix not in suffixes:
+        raise HTTPException(status_code=400, detail=f"Expected a {'/'.join(suffixes)} file: {path}")
+    models_dir = Path(CONFIG['reload_models_dir']).resolve()
+    if resolved != Path(default).resolve() and not resolved.is_relative_to(models_dir):
+        raise HTTPException(status_code=403,
+                            detail=f"Only files under {CONFIG['reload_models_dir']}/ can be loaded")
+    if not resolved.exists():
+        raise HTTPException(status_code=400, detail=f"File not found: {path}")
+    return str(resolved)
+
+@app.post("/admin/reload", status_code=202)
+async def trigger_reload(client_request: Request, request: ReloadRequest = None,
+                         x_admin_token: Optional[str] = Header(None)):
+    """Load a new checkpoint in the background and swap it in once it is warm"""
+    check_admin(client_request, x_admin_token)
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if reload_state['status'] in RELOAD_BUSY:
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    
+    request = request or ReloadRequest()
+    # Both files are unpickled/loaded: never from an arbitrary client-supplied path
+    model_path = resolve_reload_file(request.model_path or CONFIG['model_path'],
+                                     CONFIG['model_path'], ('.pth', '.torchscript'))
+    class_names_path = resolve_reload_file(request.class_names_path or CONFIG['class_names_path'],
+                                           CONFIG['class_names_path'], ('.json',))
+    
+    shadow_requests = (request.shadow_requests if request.shadow_requests is not None
+                       else CONFIG['shadow_requests'])
+    reload_state['status'] = 'loading'
+    asyncio.create_task(reload_model(model_path, class_names_path, shadow_requests,
+                                     request.force))
+    
+    return {"success": True, "message": "Reload started", "reload": reload_state}
+
+@app.get("/admin/reload")
+async def reload_status():
+    """Status of the current or last model reload"""
+    return {"success": True, "reload": reload_state}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Scheduler lane metrics, quality-gate counters and mean scores"""
+    checked = quality_stats['checked']
+    return {
+        "success": True,
+        "scheduler": scheduler.metrics(),
+        "resolution": resolution_controller.metrics(),
+        "quality_gate": {
+            "enabled": CONFIG['quality_gate'],
+            "checked": checked,
+            "rejected": quality_stats['rejected'],
+            "rejection_rate": quality_stats['rejected'] / checked if checked else None,
+            "reasons": quality_stats['reasons'],
+            "mean_scores": {k: v / checked for k, v in quality_stats['score_sums'].items()},
+            "mean_gate_ms": quality_stats['gate_ms_sum'] / checked if checked else None
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.get("/classes")
 async def get_classes():
     """Get all available disease classes"""
@@ -232,19 +1160,26 @@ async def predict_disease(file: UploadFile = File(...)):
         # Read image bytes
         image_bytes = await file.read()
         
-        # Preprocess image
-        processed_image = preprocess_image(image_bytes)
-        processed_image = processed_image.to(device)
+        # Preprocess image (photos failing the quality gate skip inference)
+        frame, quality = preprocess_image(image_bytes)
+        # Quality gate and /explain use the full-size frame; under load the
+        # model may see a downscaled copy
+        resolution = select_resolution()
+        processed_image = torch.from_numpy(resize_frames(frame.numpy(), resolution)).to(device)
         
-        # Make prediction
-        with torch.no_grad():
-            predictions = model(processed_image)
+        # Snapshot model and classes together so a hot reload can't split them
+        net, names = model, class_names
+        
+        # Make prediction (interactive lane: ahead of any queued bulk micro-batches)
+        predictions, inference_ms = await scheduler.infer('interactive', net, processed_image)
         
         # Get top predictions
-        top_predictions = get_top_predictions(predictions, top_k=5)
+        top_predictions = get_top_predictions(predictions, top_k=5, names=names)
         
         # Get primary prediction
         primary_prediction = top_predictions[0]
+        schedule_shadow_score(processed_image, primary_prediction['class'], inference_ms)
+        upload_id = remember_upload(frame, int(predictions.argmax(dim=1)[0]), primary_prediction['class'])
         
         # Check confidence threshold
         if primary_prediction['confidence'] < CONFIG['confidence_threshold']:
@@ -258,9 +1193,15 @@ async def predict_disease(file: UploadFile = File(...)):
             confidence=primary_prediction['confidence'],
             all_predictions=top_predictions,
             timestamp=datetime.now().isoformat(),
-            message=message
+            message=message,
+            quality=quality,
+            upload_id=upload_id,
+            resolution=resolution
         )
         
+    except ImageQualityError as e:
+        return JSONResponse(content=retake_response(e))
+    
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
@@ -284,47 +1225,121 @@ async def predict_batch(files: List[UploadFile] = File(...)):
     if model is None or label_encoder is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    if len(files) > 10:
+    if len(files) > CONFIG['max_batch_size']:
         raise HTTPException(
             status_code=400,
-            detail="Maximum 10 images allowed per batch"
+            detail=f"Maximum {CONFIG['max_batch_size']} images allowed per batch"
         )
     
-    results = []
+    results = [None] * len(files)
+    frames = new_frame_batch(len(files))
+    positions = []
     
-    for file in files:
+    # Decode everything straight into one uint8 buffer, then run micro-batches
+    # on zero-copy slices of it
+    for i, file in enumerate(files):
         try:
             image_bytes = await file.read()
-            processed_image = preprocess_image(image_bytes)
-            processed_image = processed_image.to(device)
-            
-            with torch.no_grad():
-                predictions = model(processed_image)
-            
-            top_predictions = get_top_predictions(predictions, top_k=3)
-            
-            results.append({
-                "filename": file.filename,
-                "success": True,
-                "prediction": top_predictions[0]['class'],
-                "confidence": top_predictions[0]['confidence'],
-                "top_predictions": top_predictions
-            })
-            
+            decode_image(image_bytes, out=frames[len(positions)])
+            if CONFIG['quality_gate']:
+                check_quality(frames[len(positions)])
+            positions.append(i)
+        except ImageQualityError as e:
+            results[i] = retake_response(e, file.filename)
         except Exception as e:
-            results.append({
+            results[i] = {
                 "filename": file.filename,
                 "success": False,
                 "error": str(e)
-            })
+            }
+    
+    net, names = model, class_names
+    step = CONFIG['micro_batch_size']
+    # One resolution for the whole request
+    resolution = select_resolution()
+    inputs = resize_frames(frames[:len(positions)], resolution)
+    
+    for start in range(0, len(positions), step):
+        chunk = positions[start:start + step]
+        try:
+            batch = torch.from_numpy(inputs[start:start + len(chunk)]).to(device)
+            # One scheduler job per micro-batch, so interactive calls can cut in between
+            predictions, _ = await scheduler.infer('bulk', net, batch)
+            
+            for row, i in enumerate(chunk):
+                top_predictions = get_top_predictions(predictions[row:row + 1], top_k=3, names=names)
+                frame = torch.from_numpy(frames[start + row:start + row + 1])
+                results[i] = {
+                    "filename": files[i].filename,
+                    "success": True,
+                    "prediction": top_predictions[0]['class'],
+                    "confidence": top_predictions[0]['confidence'],
+                    "top_predictions": top_predictions,
+                    "upload_id": remember_upload(frame, int(predictions[row].argmax()),
+                                                 top_predictions[0]['class'])
+                }
+        
+        except Exception as e:
+            for i in chunk:
+                results[i] = {
+                    "filename": files[i].filename,
+                    "success": False,
+                    "error": str(e)
+                }
     
     return {
         "success": True,
         "total_images": len(files),
+        "resolution": resolution,
         "results": results,
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/explain/{upload_id}")
+async def explain_prediction(upload_id: str):
+    """Grad-CAM overlay (PNG) showing where the model looked for a previous prediction
+    
+    Uses the upload cached by /predict or /predict/batch; computed on first
+    request, then served from cache.
+    """
+    global explain_queue
+    
+    if not CONFIG['explain_enabled']:
+        # Returned rather than raised: the 404 exception handler would replace the detail
+        return JSONResponse(status_code=404,
+                            content={"success": False, "detail": "Explanations are disabled"})
+    entry = explain_cache.get(upload_id)
+    if entry is None:
+        return JSONResponse(status_code=404,
+                            content={"success": False, "detail": "Unknown or expired upload ID"})
+    headers = {'X-Explained-Class': entry['class_name']}
+    
+    if upload_id in overlay_cache:
+        overlay_cache.move_to_end(upload_id)
+        return Response(content=overlay_cache[upload_id], media_type='image/png', headers=headers)
+    if entry['model_version'] != reload_state['model_version']:
+        raise HTTPException(status_code=410, detail="Model was reloaded since this prediction; predict again")
+    
+    if explain_queue is None:
+        explain_queue = asyncio.Queue()
+        asyncio.create_task(explain_worker())
+    
+    # Concurrent requests for the same upload share one computation
+    future = explain_inflight.get(upload_id)
+    if future is None:
+        future = asyncio.get_running_loop().create_future()
+        explain_inflight[upload_id] = future
+        explain_queue.put_nowait((upload_id, entry))
+    
+    try:
+        png = await asyncio.shield(future)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
+    
+    return Response(content=png, media_type='image/png', headers=headers)
+
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
@@ -341,11 +1356,15 @@ async def internal_error_handler(request, exc):
     )
 
 if __name__ == "__main__":
-    # Run the API server
+    # Run the API server (multiple workers if autotune.py picked them; uvicorn
+    # can't combine workers with reload)
+    profile = load_runtime_profile()
+    workers = profile['workers'] if profile else 1
     uvicorn.run(
         "api_service:app",
         host="0.0.0.0",
         port=5000,
-        reload=True,
+        reload=workers == 1,
+        workers=workers,
         log_level="info"
     )
@@ -74,8 +74,8 @@ async def load_model_on_startup():
             class_names = json.load(f)
         print(f"✓ Class names loaded: {len(class_names)} classes")
         
-        # Load Keras model
-        model = tf.keras.models.load_model(CONFIG['model_path'])
+        # Load Keras model (wrapped to take uint8 images)
+        model = with_uint8_input(tf.keras.models.load_model(CONFIG['model_path']))
         print(f"✓ Model loaded from {CONFIG['model_path']}")
         
         print("=" * 60)
@@ -86,8 +86,19 @@ async def load_model_on_startup():
         print(f"Error loading model: {e}")
         print("API will start but predictions will fail until model is loaded")
 
+def with_uint8_input(base_model: tf.keras.Model) -> tf.keras.Model:
+    """Model taking raw uint8 RGB images, with the /255 scaling as an in-graph layer"""
+    width, height = CONFIG['image_size']
+    inputs = tf.keras.Input(shape=(height, width, 3), dtype=tf.uint8)
+    # Rescaling casts to float32 inside the graph
+    scaled = tf.keras.layers.Rescaling(1.0 / 255)(inputs)
+    return tf.keras.Model(inputs, base_model(scaled))
+
 def preprocess_image(image_bytes: bytes) -> np.ndarray:
-    """Preprocess uploaded image for model prediction"""
+    """Preprocess uploaded image for model prediction
+    
+    Returns a uint8 (1, H, W, 3) array; scaling happens inside the model.
+    """
     try:
         # Convert bytes to numpy array
         nparr = np.frombuffer(image_bytes, np.uint8)
@@ -98,19 +109,15 @@ def preprocess_image(image_bytes: bytes) -> np.ndarray:
         if img is None:
             raise ValueError("Failed to decode image")
         
-        # Convert BGR to RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Resize to model input size
+        # Resize to model input size (before the colour conversion, on fewer pixels)
         img = cv2.resize(img, CONFIG['image_size'])
         
-        # Normalize to [0, 1]
-        img = img.astype(np.float32) / 255.0
-        
-        # Add batch dimension
-        img = np.expand_dims(img, axis=0)
+        # Convert BGR to RGB straight into a batch of one
+        width, height = CONFIG['image_size']
+        batch = np.empty((1, height, width, 3), dtype=np.uint8)
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=batch[0])
         
-        return img
+        return batch
         
     except Exception as e:
         raise ValueError(f"Image preprocessing failed: {str(e)}")
@@ -0,0 +1,162 @@
+"""
+Vectorized batch data augmentation for Plant Disease training
+Runs on whole collated uint8 batches (on the training device) with tensor ops,
+so augmentation adds almost nothing to the CPU-bound per-sample data path.
+
+Per-sample ops: horizontal/vertical flips, rotations by 90°, random resized
+crops and colour jitter. Batch ops: mixup / cutmix with soft targets.
+All randomness comes from one seeded generator, so runs are reproducible.
+
+Usage (benchmark):
+    python augment.py
+"""
+
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Configuration
+CONFIG = {
+    'flip_prob': 0.5,
+    'rot90': True,
+    'crop_scale': (0.6, 1.0),  # Fraction of the image area kept by random crops
+    'crop_prob': 0.5,
+    'brightness': 0.2,
+    'contrast': 0.2,
+    'saturation': 0.2,
+    'mix_prob': 0.5,  # Chance a batch gets mixup or cutmix
+    'mixup_alpha': 0.2,  # 0 disables mixup
+    'cutmix_alpha': 1.0  # 0 disables cutmix
+}
+
+class BatchAugment:
+    """Random augmentation of a whole batch with tensor ops"""
+    def __init__(self, num_classes, seed=42, **overrides):
+        self.num_classes = num_classes
+        self.params = {**CONFIG, **overrides}
+        self.rng = np.random.default_rng(seed)
+
+    def _rand(self, size, device, low=0.0, high=1.0):
+        """Per-sample uniform values from the seeded generator, as a device tensor"""
+        return torch.from_numpy(self.rng.uniform(low, high, size).astype(np.float32)).to(device)
+
+    def _flip_and_rotate(self, images):
+        n = images.shape[0]
+        p = self.params
+        if p['flip_prob'] > 0:
+            mask = (self._rand(n, images.device) < p['flip_prob']).view(n, 1, 1, 1)
+            images = torch.where(mask, images.flip(3), images)
+            mask = (self._rand(n, images.device) < p['flip_prob']).view(n, 1, 1, 1)
+            images = torch.where(mask, images.flip(2), images)
+        if p['rot90'] and images.shape[2] == images.shape[3]:
+            turns = torch.from_numpy(self.rng.integers(0, 4, n)).to(images.device)
+            rotated = images.clone()
+            for k in (1, 2, 3):
+                idx = (turns == k).nonzero(as_tuple=True)[0]
+                if len(idx):
+                    rotated[idx] = torch.rot90(images[idx], k, dims=(2, 3))
+            images = rotated
+        return images
+
+    def _crop(self, images):
+        """Random resized crops for a subset of the batch via one affine grid_sample"""
+        n = images.shape[0]
+        low, high = self.params['crop_scale']
+        scale = torch.sqrt(self._rand(n, images.device, low, high))
+        keep = self._rand(n, images.device) >= self.params['crop_prob']
+        scale = torch.where(keep, torch.ones_like(scale), scale)
+        tx = (self._rand(n, images.device) * 2 - 1) * (1 - scale)
+        ty = (self._rand(n, images.device) * 2 - 1) * (1 - scale)
+
+        theta = torch.zeros(n, 2, 3, device=images.device)
+        theta[:, 0, 0] = scale
+        theta[:, 1, 1] = scale
+        theta[:, 0, 2] = tx
+        theta[:, 1, 2] = ty
+        grid = F.affine_grid(theta, images.shape, align_corners=False)
+        return F.grid_sample(images, grid, mode='bilinear', padding_mode='reflection',
+                             align_corners=False)
+
+    def _jitter(self, images):
+        """Per-sample brightness, contrast and saturation on 0-255 float images"""
+        n = images.shape[0]
+        p = self.params
+        shape = (n, 1, 1, 1)
+        weights = torch.tensor([0.299, 0.587, 0.114], device=images.device).view(1, 3, 1, 1)
+
+        if p['brightness'] > 0:
+            images = images * self._rand(n, images.device, 1 - p['brightness'], 1 + p['brightness']).view(shape)
+        if p['contrast'] > 0:
+            factor = self._rand(n, images.device, 1 - p['contrast'], 1 + p['contrast']).view(shape)
+            mean = (images * weights).sum(1, keepdim=True).mean((2, 3), keepdim=True)
+            images = (images - mean) * factor + mean
+        if p['saturation'] > 0:
+            factor = self._rand(n, images.device, 1 - p['saturation'], 1 + p['saturation']).view(shape)
+            gray = (images * weights).sum(1, keepdim=True)
+            images = (images - gray) * factor + gray
+        return images.clamp_(0, 255)
+
+    def __call__(self, images):
+        """Augment a uint8 NCHW batch, returning float values in 0-255"""
+        images = self._flip_and_rotate(images).float()
+        if self.params['crop_prob'] > 0:
+            images = self._crop(images)
+        return self._jitter(images)
+
+    def mix(self, images, labels):
+        """Mixup or cutmix a normalized batch; returns images and soft targets"""
+        p = self.params
+        targets = F.one_hot(labels, self.num_classes).float()
+        modes = [m for m, alpha in (('mixup', p['mixup_alpha']), ('cutmix', p['cutmix_alpha'])) if alpha > 0]
+        if not modes or self.rng.random() >= p['mix_prob']:
+            return images, targets
+
+        mode = modes[self.rng.integers(len(modes))]
+        perm = torch.from_numpy(self.rng.permutation(images.shape[0])).to(images.device)
+        lam = float(self.rng.beta(p[f'{mode}_alpha'], p[f'{mode}_alpha']))
+
+        if mode == 'mixup':
+            images = images * lam + images[perm] * (1 - lam)
+        else:
+            height, width = images.shape[2], images.shape[3]
+            cut_h, cut_w = int(height * np.sqrt(1 - lam)), int(width * np.sqrt(1 - lam))
+            cy, cx = self.rng.integers(height), self.rng.integers(width)
+            y1, y2 = max(cy - cut_h // 2, 0), min(cy + cut_h // 2, height)
+            x1, x2 = max(cx - cut_w // 2, 0), min(cx + cut_w // 2, width)
+            images = images.clone()
+            images[:, :, y1:y2, x1:x2] = images[perm, :, y1:y2, x1:x2]
+            # Use the area actually pasted after clipping at the borders
+            lam = 1 - (y2 - y1) * (x2 - x1) / (height * width)
+
+        return images, targets * lam + targets[perm] * (1 - lam)
+
+def benchmark(batch_size=32, image_size=(224, 224), num_classes=15, steps=50):
+    """Compare batch-transform throughput with and without augmentation"""
+    from train_model import BatchTransform
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    batch = torch.randint(0, 256, (batch_size, 3, image_size[1], image_size[0]), dtype=torch.uint8)
+    labels = torch.randint(0, num_classes, (batch_size,))
+    augment = BatchAugment(num_classes)
+    plain = BatchTransform(device)
+    augmented = BatchTransform(device, augment=augment)
+
+    results = {}
+    for name, transform in (('no augmentation', plain), ('augmentation', augmented)):
+        start = time.perf_counter()
+        for _ in range(steps):
+            images = transform(batch)
+            if transform.augment is not None:
+                images, _ = transform.augment.mix(images, labels.to(device))
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        results[name] = steps * batch_size / (time.perf_counter() - start)
+        print(f"{name:<16}: {results[name]:8.0f} img/s")
+
+    print(f"Augmentation keeps {100 * results['augmentation'] / results['no augmentation']:.0f}% "
+          f"of the un-augmented throughput")
+    return results
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,215 @@
+"""
+CPU Thread / Worker Autotuner for the Plant Disease Detection API
+Sweeps uvicorn workers, torch intra-op/inter-op threads, micro-batch size and
+the scheduler's concurrent forward passes (inference_workers) against the real model and writes the best setting to runtime_profile.json,
+which api_service.py applies at startup.
+
+Usage:
+    python autotune.py
+    python autotune.py --workers 1 2 4 --batch-sizes 1 4 8 --p99-target-ms 500
+"""
+
+import os
+import json
+import time
+import argparse
+import itertools
+import threading
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+
+# Configuration
+CONFIG = {
+    'sample_dir': 'static/uploads',
+    'profile_path': 'runtime_profile.json',
+    'duration': 10.0,  # Seconds of measured inference per setting
+    'warmup_batches': 3,
+    'batch_sizes': [1, 4, 8],
+    'interop_threads': [1, 2],
+    'inference_workers': [1, 2]  # Concurrent forward passes per worker (api_service scheduler)
+}
+
+def load_sample_images(sample_dir):
+    """Read raw image bytes from the uploads folder"""
+    paths = [p for p in sorted(Path(sample_dir).glob('*'))
+             if p.suffix.lower() in ['.jpg', '.jpeg', '.png']]
+    if not paths:
+        raise FileNotFoundError(f"No sample images found in {sample_dir}")
+    return [p.read_bytes() for p in paths]
+
+def core_sets(workers, threads):
+    """Disjoint core sets for each worker, or None if they don't fit"""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    if not cores or workers * threads > len(cores):
+        return None
+    return [cores[i * threads:(i + 1) * threads] for i in range(workers)]
+
+def candidate_settings(worker_counts, batch_sizes, interop_threads, inference_workers, pin):
+    """All worker/thread/batch combinations that don't oversubscribe the CPU"""
+    num_cores = os.cpu_count()
+    settings = []
+    for workers in worker_counts:
+        max_threads = num_cores // workers
+        if max_threads < 1:
+            continue
+        # Powers of two up to the per-worker share, plus the full share
+        thread_counts = sorted({t for t in [1, 2, 4, 8, 16, 32, 64] if t <= max_threads} | {max_threads})
+        for threads, interop, batch_size, streams in itertools.product(
+                thread_counts, interop_threads, batch_sizes, inference_workers):
+            # Each concurrent forward pass needs at least one intra-op thread
+            if streams > threads:
+                continue
+            settings.append({
+                'workers': workers,
+                'threads': threads,
+                'interop_threads': interop,
+                'micro_batch_size': batch_size,
+                'inference_workers': streams,
+                'cpu_affinity': core_sets(workers, threads) if pin else None
+            })
+    return settings
+
+def benchmark_worker(worker_index, setting, images, duration, barrier, queue):
+    """Run the model in one process with the given setting and report batch latencies
+
+    Like the service's scheduler, `inference_workers` threads run forward passes
+    concurrently, sharing the worker's intra-op threads equally.
+    """
+    if setting['cpu_affinity']:
+        os.sched_setaffinity(0, setting['cpu_affinity'][worker_index])
+
+    import torch
+    streams = setting['inference_workers']
+    torch.set_num_threads(max(1, setting['threads'] // streams))
+    torch.set_num_interop_threads(setting['interop_threads'])
+
+    import api_service
+    api_service.device = torch.device('cpu')
+    # Benchmark every sample image, whatever its photo quality
+    api_service.CONFIG['quality_gate'] = False
+    net, _ = api_service.load_model_bundle(api_service.CONFIG['model_path'],
+                                           api_service.CONFIG['class_names_path'],
+                                           allow_pretrained_fallback=True)
+
+    # Build one batch from the sample images (repeated if there are too few)
+    tensors = [api_service.preprocess_image(images[i % len(images)])[0]
+               for i in range(setting['micro_batch_size'])]
+    batch = torch.cat(tensors)
+
+    with torch.no_grad():
+        for _ in range(CONFIG['warmup_batches']):
+            net(batch)
+
+    latencies = []
+
+    def stream():
+        with torch.no_grad():
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                batch_start = time.perf_counter()
+                net(batch)
+                latencies.append((time.perf_counter() - batch_start) * 1000)
+
+    barrier.wait()
+    threads = [threading.Thread(target=stream) for _ in range(streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    queue.put({'worker': worker_index, 'latencies_ms': latencies,
+               'images': len(latencies) * setting['micro_batch_size']})
+
+def run_setting(setting, images, duration):
+    """Benchmark all workers of a setting concurrently"""
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(setting['workers'])
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=benchmark_worker,
+                         args=(i, setting, images, duration, barrier, queue))
+             for i in range(setting['workers'])]
+    for p in procs:
+        p.start()
+    reports = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    latencies = np.concatenate([r['latencies_ms'] for r in reports])
+    return {
+        **setting,
+        'throughput': sum(r['images'] for r in reports) / duration,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+def pick_best(results, p99_target_ms):
+    """Highest throughput, restricted to settings that meet the p99 target if one is set"""
+    eligible = [r for r in results if p99_target_ms is None or r['p99_ms'] <= p99_target_ms]
+    if not eligible:
+        print(f"No setting met p99 <= {p99_target_ms} ms, using lowest p99 instead")
+        return min(results, key=lambda r: r['p99_ms'])
+    return max(eligible, key=lambda r: r['throughput'])
+
+def main():
+    """Sweep settings and write the runtime profile"""
+    parser = argparse.ArgumentParser(description="Tune workers/threads/batch size for api_service.py")
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="Worker counts to try (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=CONFIG['batch_sizes'])
+    parser.add_argument('--interop-threads', type=int, nargs='+', default=CONFIG['interop_threads'])
+    parser.add_argument('--inference-workers', type=int, nargs='+', default=CONFIG['inference_workers'],
+                        help="Concurrent forward passes per worker to try")
+    parser.add_argument('--duration', type=float, default=CONFIG['duration'])
+    parser.add_argument('--p99-target-ms', type=float, default=None)
+    parser.add_argument('--no-pin', action='store_true', help="Don't pin workers to CPU cores")
+    parser.add_argument('--output', default=CONFIG['profile_path'])
+    args = parser.parse_args()
+
+    num_cores = os.cpu_count()
+    worker_counts = args.workers or [w for w in [1, 2, 4, 8, 16, 32] if w <= num_cores]
+    images = load_sample_images(CONFIG['sample_dir'])
+    settings = candidate_settings(worker_counts, args.batch_sizes, args.interop_threads,
+                                  args.inference_workers, pin=not args.no_pin)
+
+    print("=" * 60)
+    print(f"Autotuning on {num_cores} cores with {len(images)} sample images")
+    print(f"{len(settings)} settings, {args.duration:.0f}s each")
+    print("=" * 60)
+
+    results = []
+    for setting in settings:
+        result = run_setting(setting, images, args.duration)
+        results.append(result)
+        print(f"workers={result['workers']:<3} threads={result['threads']:<3} "
+              f"interop={result['interop_threads']} batch={result['micro_batch_size']:<3} "
+              f"streams={result['inference_workers']} "
+              f"-> {result['throughput']:7.1f} img/s, p99 {result['p99_ms']:7.1f} ms")
+
+    best = pick_best(results, args.p99_target_ms)
+    profile = {
+        'workers': best['workers'],
+        'threads': best['threads'],
+        'interop_threads': best['interop_threads'],
+        'micro_batch_size': best['micro_batch_size'],
+        'inference_workers': best['inference_workers'],
+        'cpu_affinity': best['cpu_affinity'],
+        'throughput': best['throughput'],
+        'p50_ms': best['p50_ms'],
+        'p99_ms': best['p99_ms'],
+        'cpu_count': num_cores,
+        'sweep': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+    print("=" * 60)
+    print(f"✓ Best: {best['workers']} workers x {best['threads']} threads "
+          f"(inter-op {best['interop_threads']}), micro-batch {best['micro_batch_size']}, "
+          f"{best['inference_workers']} concurrent forward passes")
+    print(f"  {best['throughput']:.1f} img/s, p99 {best['p99_ms']:.1f} ms")
+    print(f"✓ Profile saved to {args.output}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
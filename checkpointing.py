@@ -0,0 +1,91 @@
+"""
+Asynchronous, rotating training checkpoints
+The training loop only pays for copying the state to CPU memory; serializing
+and writing to disk happens in a background thread. The last N checkpoints
+are kept so `python train_model.py --resume` can continue a crashed run.
+"""
+
+import os
+import re
+import time
+import queue
+import threading
+from pathlib import Path
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r'checkpoint_e(\d+)_s(\d+)\.pt$')
+
+def to_cpu(obj):
+    """Deep copy of a (nested) state with every tensor cloned to CPU"""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+def list_checkpoints(checkpoint_dir):
+    """Checkpoint files in (epoch, step) order"""
+    found = []
+    for path in Path(checkpoint_dir).glob('checkpoint_e*_s*.pt'):
+        match = CHECKPOINT_PATTERN.search(path.name)
+        if match:
+            found.append(((int(match.group(1)), int(match.group(2))), path))
+    return [path for _, path in sorted(found)]
+
+def latest_checkpoint(checkpoint_dir):
+    """Most recent checkpoint, or None"""
+    checkpoints = list_checkpoints(checkpoint_dir)
+    return checkpoints[-1] if checkpoints else None
+
+class AsyncCheckpointer:
+    """Writes checkpoints on a background thread and keeps the last `keep`"""
+    def __init__(self, checkpoint_dir, keep=3):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.keep = keep
+        self.blocking_time = 0.0  # Seconds the training loop spent in save()
+        self.saves = 0
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            path, state = item
+            try:
+                # Write then rename, so a crash mid-write never leaves a truncated checkpoint
+                tmp_path = path.with_suffix('.tmp')
+                torch.save(state, tmp_path)
+                os.replace(tmp_path, path)
+                for old in list_checkpoints(self.checkpoint_dir)[:-self.keep]:
+                    old.unlink()
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def save(self, state, epoch, step):
+        """Snapshot the state to CPU and queue it for writing"""
+        if self._error:
+            raise RuntimeError(f"Background checkpoint write failed: {self._error}")
+        start = time.perf_counter()
+        snapshot = to_cpu(state)
+        # Blocks only if the previous checkpoint is still being written
+        self._queue.put((self.checkpoint_dir / f'checkpoint_e{epoch:03d}_s{step:06d}.pt', snapshot))
+        self.blocking_time += time.perf_counter() - start
+        self.saves += 1
+
+    def close(self):
+        """Wait for pending writes and stop the writer thread"""
+        self._queue.put(None)
+        self._queue.join()
+        self._thread.join()
+        if self._error:
+            raise RuntimeError(f"Background checkpoint write failed: {self._error}")
@@ -0,0 +1,140 @@
+"""
+Model compression for Plant Disease serving
+Structured channel pruning and quantization-aware training (QAT) helpers used by
+`python train_model.py --mode compress`.
+
+Pruning removes whole expansion channels inside EfficientNet's inverted-residual
+blocks (pointwise expand conv, depthwise conv, squeeze-excite and projection),
+ranked by the depthwise BatchNorm scale, so residual widths are untouched and
+the result is a plain, smaller dense model. QAT uses FX graph mode with fake
+quantization, then converts to an int8 model for CPU inference.
+"""
+
+import copy
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qat_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_qat_fx, convert_fx
+
+def count_flops(model, image_size=(224, 224)):
+    """Multiply-accumulates of one forward pass, from Conv2d/Linear shapes"""
+    total = 0
+
+    def conv_hook(module, inputs, output):
+        nonlocal total
+        kernel = module.kernel_size[0] * module.kernel_size[1]
+        total += output.numel() * (module.in_channels // module.groups) * kernel
+
+    def linear_hook(module, inputs, output):
+        nonlocal total
+        total += output.numel() * module.in_features
+
+    handles = []
+    for module in model.modules():
+        if isinstance(module, nn.Conv2d):
+            handles.append(module.register_forward_hook(conv_hook))
+        elif isinstance(module, nn.Linear):
+            handles.append(module.register_forward_hook(linear_hook))
+
+    device = next(model.parameters()).device
+    was_training = model.training
+    model.eval()
+    with torch.no_grad():
+        model(torch.zeros(1, 3, image_size[1], image_size[0], device=device))
+    model.train(was_training)
+    for handle in handles:
+        handle.remove()
+    return total
+
+def _slice_conv(conv, out_idx=None, in_idx=None):
+    """Keep the given output/input channels of a conv in place"""
+    weight = conv.weight.data
+    if out_idx is not None:
+        weight = weight[out_idx]
+        if conv.bias is not None:
+            conv.bias = nn.Parameter(conv.bias.data[out_idx].clone())
+        conv.out_channels = len(out_idx)
+    if conv.groups > 1:
+        # Depthwise: one filter per channel
+        conv.groups = conv.in_channels = conv.out_channels
+    elif in_idx is not None:
+        weight = weight[:, in_idx]
+        conv.in_channels = len(in_idx)
+    conv.weight = nn.Parameter(weight.clone())
+
+def _slice_bn(bn, idx):
+    """Keep the given channels of a BatchNorm (incl. timm's BatchNormAct2d)"""
+    bn.weight = nn.Parameter(bn.weight.data[idx].clone())
+    bn.bias = nn.Parameter(bn.bias.data[idx].clone())
+    bn.running_mean = bn.running_mean[idx].clone()
+    bn.running_var = bn.running_var[idx].clone()
+    bn.num_features = len(idx)
+
+def prunable_blocks(model):
+    """Inverted-residual blocks (expand -> depthwise -> SE -> project)"""
+    return [m for m in model.modules()
+            if all(hasattr(m, name) for name in ('conv_pw', 'bn1', 'conv_dw', 'bn2', 'conv_pwl'))]
+
+def prune_block(block, ratio, divisor=8):
+    """Drop the least important `ratio` of a block's expansion channels"""
+    importance = block.bn2.weight.data.abs()
+    channels = importance.numel()
+    keep = max(divisor, int(round(channels * (1 - ratio) / divisor)) * divisor)
+    if keep >= channels:
+        return
+    idx = importance.argsort(descending=True)[:keep].sort().values
+
+    _slice_conv(block.conv_pw, out_idx=idx)
+    _slice_bn(block.bn1, idx)
+    _slice_conv(block.conv_dw, out_idx=idx)
+    _slice_bn(block.bn2, idx)
+    if hasattr(block.se, 'conv_reduce'):
+        _slice_conv(block.se.conv_reduce, in_idx=idx)
+        _slice_conv(block.se.conv_expand, out_idx=idx)
+    _slice_conv(block.conv_pwl, in_idx=idx)
+
+def prune_model(model, ratio):
+    """Copy of the model with every inverted-residual block pruned by `ratio`"""
+    pruned = copy.deepcopy(model)
+    for block in prunable_blocks(pruned):
+        prune_block(block, ratio)
+    return pruned
+
+def prune_to_budget(model, flop_budget, image_size=(224, 224), max_ratio=0.9, steps=12):
+    """Smallest uniform pruning ratio whose model fits `flop_budget` x the original FLOPs
+
+    Returns (pruned model, ratio, original FLOPs, pruned FLOPs).
+    """
+    base_flops = count_flops(model, image_size)
+    target = base_flops * flop_budget
+    low, high = 0.0, max_ratio
+    best = prune_model(model, max_ratio)
+    best_ratio = max_ratio
+    for _ in range(steps):
+        ratio = (low + high) / 2
+        candidate = prune_model(model, ratio)
+        if count_flops(candidate, image_size) <= target:
+            best, best_ratio, high = candidate, ratio, ratio
+        else:
+            low = ratio
+    return best, best_ratio, base_flops, count_flops(best, image_size)
+
+def prepare_qat(model, image_size=(224, 224), backend='x86'):
+    """Insert fake-quantization observers for quantization-aware fine-tuning (on CPU)"""
+    torch.backends.quantized.engine = backend
+    model = model.cpu().train()
+    example = (torch.randn(1, 3, image_size[1], image_size[0]),)
+    return prepare_qat_fx(model, get_default_qat_qconfig_mapping(backend), example)
+
+def convert_qat(model):
+    """Convert a QAT-prepared model to an int8 CPU model"""
+    return convert_fx(model.cpu().eval())
+
+def export_torchscript(model, path, image_size=(224, 224)):
+    """Trace and save the model for inference; returns the traced module"""
+    model = model.cpu().eval()
+    example = torch.randn(1, 3, image_size[1], image_size[0])
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    torch.jit.save(traced, path)
+    return traced
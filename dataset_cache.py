@@ -0,0 +1,283 @@
+"""
+Memory-mapped dataset cache for PlantVillage training
+Decodes and resizes every image once into uint8 .npy shards that are memory-mapped
+at training time, so reruns start in seconds and RAM use stays bounded.
+
+Ingestion runs across a process pool and is incremental: a manifest records each
+source file's size, mtime, content hash and label, so later runs only decode new
+or changed files (e.g. newly confirmed field uploads) and append them as new shards.
+
+Cache layout:
+    index.json       image size, class names and shard file list
+    manifest.json    path -> size, mtime, sha1, label, shard, row
+    labels.npy       int64 class index per sample
+    locations.npy    int64 (shard, row) per sample
+    shard_00000.npy  uint8 (n, height, width, 3) RGB images
+
+Usage:
+    python dataset_cache.py --dataset PlantVillage --output dataset_cache
+    python dataset_cache.py --dataset PlantVillage --dataset confirmed_uploads
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+
+def decode_image(img_path, image_size):
+    """Read an image as resized uint8 RGB"""
+    img = cv2.imread(str(img_path))
+    if img is None:
+        raise ValueError("Failed to decode image")
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.resize(img, image_size)
+
+def _init_ingest_worker():
+    # One process per core already; keep OpenCV from spawning its own threads
+    cv2.setNumThreads(1)
+
+def ingest_file(args):
+    """Hash and (unless the hash is already known) decode one file in a pool worker"""
+    img_path, image_size, known_hash = args
+    try:
+        data = Path(img_path).read_bytes()
+        sha1 = hashlib.sha1(data).hexdigest()
+        if sha1 == known_hash:
+            return sha1, None, None
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Failed to decode image")
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return sha1, cv2.resize(img, image_size), None
+    except Exception as e:
+        return None, None, str(e)
+
+def list_images(dataset_paths):
+    """(path, class name) pairs for one or more class-per-folder datasets"""
+    files = []
+    for dataset_path in dataset_paths:
+        dataset_dir = Path(dataset_path)
+        if not dataset_dir.exists():
+            raise FileNotFoundError(f"Dataset directory not found: {dataset_path}")
+        for class_dir in sorted(d for d in dataset_dir.iterdir() if d.is_dir()):
+            for img_path in sorted(class_dir.glob('*')):
+                if img_path.suffix.lower() in IMAGE_EXTENSIONS:
+                    files.append((str(img_path), class_dir.name))
+    return files
+
+def write_shard(cache_dir, shard_id, images):
+    """Write a list of equally sized uint8 images to a new .npy shard"""
+    shard_file = f'shard_{shard_id:05d}.npy'
+    shard = np.lib.format.open_memmap(cache_dir / shard_file, mode='w+', dtype=np.uint8,
+                                      shape=(len(images),) + images[0].shape)
+    for row, img in enumerate(images):
+        shard[row] = img
+    shard.flush()
+    del shard
+    return shard_file
+
+def write_index(cache_dir, image_size, shard_files, manifest):
+    """Write the label/location arrays and index from the manifest"""
+    paths = sorted(manifest)
+    class_names = sorted({manifest[p]['label'] for p in paths})
+    class_to_idx = {name: i for i, name in enumerate(class_names)}
+
+    labels = [class_to_idx[manifest[p]['label']] for p in paths]
+    locations = [(manifest[p]['shard'], manifest[p]['row']) for p in paths]
+    np.save(cache_dir / 'labels.npy', np.asarray(labels, dtype=np.int64))
+    np.save(cache_dir / 'locations.npy', np.asarray(locations, dtype=np.int64).reshape(-1, 2))
+
+    with open(cache_dir / 'manifest.json', 'w') as f:
+        json.dump(manifest, f)
+    with open(cache_dir / 'index.json', 'w') as f:
+        json.dump({
+            'image_size': list(image_size),
+            'class_names': class_names,
+            'shards': shard_files,
+            'num_images': len(paths)
+        }, f, indent=2)
+
+def load_existing(cache_dir, image_size):
+    """Manifest and shard list of an existing cache, or empty if it must be rebuilt"""
+    index_path = cache_dir / 'index.json'
+    manifest_path = cache_dir / 'manifest.json'
+    if not index_path.exists() or not manifest_path.exists():
+        return {}, []
+
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    if tuple(index['image_size']) != tuple(image_size):
+        print(f"Cached image size {tuple(index['image_size'])} differs, rebuilding cache")
+        shutil.rmtree(cache_dir)
+        cache_dir.mkdir(parents=True)
+        return {}, []
+
+    with open(manifest_path, 'r') as f:
+        return json.load(f), index['shards']
+
+def build_cache(dataset_paths, cache_dir, image_size=(224, 224), shard_size=4096,
+                num_workers=None):
+    """Build or incrementally update the memory-mapped cache"""
+    if isinstance(dataset_paths, (str, Path)):
+        dataset_paths = [dataset_paths]
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    num_workers = num_workers or os.cpu_count()
+
+    manifest, shard_files = load_existing(cache_dir, image_size)
+    files = list_images(dataset_paths)
+    seen = set()
+    pending = []
+
+    # Unchanged size and mtime -> reuse without reading the file
+    for img_path, label in files:
+        seen.add(img_path)
+        stat = os.stat(img_path)
+        entry = manifest.get(img_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime \
+                and entry['label'] == label:
+            continue
+        pending.append((img_path, label, stat))
+
+    removed = [p for p in manifest if p not in seen]
+    for img_path in removed:
+        del manifest[img_path]
+
+    print(f"Dataset cache: {len(files)} files, {len(pending)} new or changed, "
+          f"{len(removed)} removed")
+
+    decoded = 0
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_ingest_worker) as pool:
+        for start in tqdm(range(0, len(pending), shard_size), desc="Ingesting"):
+            chunk = pending[start:start + shard_size]
+            jobs = [(p, image_size, manifest[p]['sha1'] if p in manifest else None)
+                    for p, _, _ in chunk]
+            images = []
+            new_entries = []
+
+            for (img_path, label, stat), (sha1, img, error) in zip(
+                    chunk, pool.map(ingest_file, jobs, chunksize=16)):
+                if error:
+                    print(f"Error loading {img_path}: {error}")
+                    manifest.pop(img_path, None)
+                    continue
+                if img is None:
+                    # Touched but same content: keep the cached row
+                    manifest[img_path].update(size=stat.st_size, mtime=stat.st_mtime, label=label)
+                    continue
+                images.append(img)
+                new_entries.append((img_path, {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'sha1': sha1,
+                    'label': label,
+                    'shard': len(shard_files),
+                    'row': len(images) - 1
+                }))
+
+            if images:
+                shard_files.append(write_shard(cache_dir, len(shard_files), images))
+                manifest.update(new_entries)
+                decoded += len(images)
+
+    write_index(cache_dir, image_size, shard_files, manifest)
+    print(f"✓ Cache ready: {len(manifest)} images ({decoded} decoded this run) "
+          f"in {len(shard_files)} shards")
+    return ImageCache(cache_dir)
+
+class ImageCache:
+    """Read-only, indexable view over the memory-mapped image shards"""
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / 'index.json', 'r') as f:
+            index = json.load(f)
+        self.image_size = tuple(index['image_size'])
+        self.class_names = index['class_names']
+        self.shard_files = index['shards']
+        self.labels = np.load(self.cache_dir / 'labels.npy')
+        self.locations = np.load(self.cache_dir / 'locations.npy')
+        self._shards = None
+        self._paths = None
+
+    @property
+    def paths(self):
+        """Source file of every sample (read from the manifest on first use)"""
+        if self._paths is None:
+            with open(self.cache_dir / 'manifest.json', 'r') as f:
+                self._paths = sorted(json.load(f))
+        return self._paths
+
+    def _open_shards(self):
+        # Opened lazily so each DataLoader worker maps the files itself
+        self._shards = [np.load(self.cache_dir / f, mmap_mode='r') for f in self.shard_files]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._open_shards()
+        shard, row = self.locations[idx]
+        return self._shards[shard][row]
+
+    def __getstate__(self):
+        # Never pickle the mapped arrays (that would copy the whole dataset)
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        state['_paths'] = None
+        return state
+
+class ImageFiles:
+    """Indexable view over image files that decodes and resizes on demand"""
+    def __init__(self, dataset_paths, image_size=(224, 224)):
+        if isinstance(dataset_paths, (str, Path)):
+            dataset_paths = [dataset_paths]
+        files = list_images(dataset_paths)
+        self.image_size = tuple(image_size)
+        self.class_names = sorted({label for _, label in files})
+        class_to_idx = {name: i for i, name in enumerate(self.class_names)}
+        self.paths = [p for p, _ in files]
+        self.labels = np.array([class_to_idx[label] for _, label in files], dtype=np.int64)
+
+    @classmethod
+    def from_files(cls, files, image_size=(224, 224)):
+        """View over an explicit list of (path, class name) pairs instead of directories"""
+        view = cls([], image_size)
+        view.class_names = sorted({label for _, label in files})
+        class_to_idx = {name: i for i, name in enumerate(view.class_names)}
+        view.paths = [str(p) for p, _ in files]
+        view.labels = np.array([class_to_idx[label] for _, label in files], dtype=np.int64)
+        return view
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        return decode_image(self.paths[idx], self.image_size)
+
+def main():
+    """Build or update the cache from the command line"""
+    from train_model import CONFIG as TRAIN_CONFIG
+
+    parser = argparse.ArgumentParser(description="Build/update the memory-mapped PlantVillage cache")
+    parser.add_argument('--dataset', action='append', default=None,
+                        help="Class-per-folder image directory (repeatable)")
+    parser.add_argument('--output', default=TRAIN_CONFIG['cache_dir'])
+    parser.add_argument('--shard-size', type=int, default=TRAIN_CONFIG['cache_shard_size'])
+    parser.add_argument('--workers', type=int, default=TRAIN_CONFIG['ingest_workers'])
+    args = parser.parse_args()
+
+    dataset_paths = args.dataset or [TRAIN_CONFIG['dataset_path']] + TRAIN_CONFIG['extra_dataset_paths']
+    build_cache(dataset_paths, args.output, TRAIN_CONFIG['image_size'],
+                args.shard_size, args.workers)
+
+if __name__ == "__main__":
+    main()
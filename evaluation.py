@@ -0,0 +1,287 @@
+"""
+Vectorized evaluation engine for Plant Disease models
+Accumulates a confusion matrix on the device with one bincount per batch and
+derives accuracy, per-class and weighted precision/recall/F1 from it in a single
+step. Plots are optional and rendered on a background thread, off the critical
+path. Evaluation can be split across processes (shards), whose confusion
+matrices are simply summed. The same images can be scored at several input
+resolutions to validate the reduced sizes used by the service's adaptive mode.
+
+Usage (deployed checkpoint against any class-per-folder directory):
+    python evaluation.py --data holdout_images
+    python evaluation.py --model student_plant_disease.pth --data holdout_images --workers 4
+    python evaluation.py --data holdout_images --resolutions 224 192 160
+"""
+
+import os
+import json
+import argparse
+import time
+import threading
+import multiprocessing as mp
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from dataset_cache import decode_image, list_images
+
+def update_confusion(cm, labels, preds):
+    """Add a batch to a (num_classes x num_classes) confusion matrix tensor, in place"""
+    num_classes = cm.shape[0]
+    cm += torch.bincount(labels * num_classes + preds,
+                         minlength=num_classes * num_classes).view(num_classes, num_classes)
+    return cm
+
+def compute_metrics(cm):
+    """Accuracy plus per-class, macro and weighted precision/recall/F1 from a confusion matrix"""
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    total = support.sum()
+
+    # Classes never predicted (or absent) score 0, as sklearn's zero_division default
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    denom = precision + recall
+    f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+    weights = support / max(total, 1)
+
+    return {
+        'accuracy': float(tp.sum() / max(total, 1)),
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'support': support.astype(np.int64),
+        'macro': {'precision': float(precision.mean()), 'recall': float(recall.mean()),
+                  'f1': float(f1.mean())},
+        'weighted': {'precision': float(precision @ weights), 'recall': float(recall @ weights),
+                     'f1': float(f1 @ weights)},
+        'total': int(total)
+    }
+
+def format_report(metrics, class_names, digits=4):
+    """Text report in the layout of sklearn's classification_report"""
+    width = max(len(name) for name in list(class_names) + ['weighted avg'])
+    header = f"{'':>{width}} {'precision':>9} {'recall':>9} {'f1-score':>9} {'support':>9}"
+    lines = [header, '']
+    for i, name in enumerate(class_names):
+        lines.append(f"{name:>{width}} {metrics['precision'][i]:>9.{digits}f} "
+                     f"{metrics['recall'][i]:>9.{digits}f} {metrics['f1'][i]:>9.{digits}f} "
+                     f"{metrics['support'][i]:>9}")
+    lines.append('')
+    lines.append(f"{'accuracy':>{width}} {'':>9} {'':>9} {metrics['accuracy']:>9.{digits}f} "
+                 f"{metrics['total']:>9}")
+    for avg in ('macro', 'weighted'):
+        m = metrics[avg]
+        lines.append(f"{avg + ' avg':>{width}} {m['precision']:>9.{digits}f} {m['recall']:>9.{digits}f} "
+                     f"{m['f1']:>9.{digits}f} {metrics['total']:>9}")
+    return '\n'.join(lines) + '\n'
+
+def evaluate(model, dataloader, num_classes, device, batch_transform, precision=None):
+    """Confusion matrix of a model over a dataloader (one host sync at the end)"""
+    model.eval()
+    cm = torch.zeros(num_classes, num_classes, dtype=torch.int64, device=device)
+    with torch.no_grad():
+        for images, labels in tqdm(dataloader, desc='Testing'):
+            images = batch_transform(images)
+            if precision is not None:
+                with precision.autocast():
+                    outputs = model(images)
+            else:
+                outputs = model(images)
+            update_confusion(cm, labels.to(device, non_blocking=True), outputs.argmax(1))
+    return cm.cpu().numpy()
+
+def plot_confusion_matrix(cm, class_names, path='confusion_matrix.png', dpi=120):
+    """Render the confusion matrix heatmap on a background thread; returns the thread
+
+    Uses the object-oriented matplotlib API (no pyplot state), so it is safe to
+    run while the caller carries on.
+    """
+    def render():
+        from matplotlib.figure import Figure
+        import seaborn as sns
+
+        size = max(8, len(class_names) * 0.5)
+        fig = Figure(figsize=(size * 1.1, size))
+        ax = fig.add_subplot()
+        sns.heatmap(cm, annot=len(class_names) <= 40, fmt='d', cmap='Blues', ax=ax,
+                    xticklabels=class_names, yticklabels=class_names)
+        ax.set_title('Confusion Matrix')
+        ax.set_ylabel('True Label')
+        ax.set_xlabel('Predicted Label')
+        ax.tick_params(axis='x', labelrotation=90)
+        ax.tick_params(axis='y', labelrotation=0)
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi)
+        print(f"Confusion matrix saved to '{path}'")
+
+    thread = threading.Thread(target=render, name='confusion-matrix-plot')
+    thread.start()
+    return thread
+
+def save_report(cm, class_names, output_dir='.', plot=True, dpi=120):
+    """Write classification_report.txt, test_metrics.json and (optionally) the heatmap
+
+    Returns (metrics, plot thread or None); join the thread if the image is needed.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    metrics = compute_metrics(cm)
+    report = format_report(metrics, class_names)
+    print("\nClassification Report:")
+    print(report)
+    with open(output_dir / 'classification_report.txt', 'w') as f:
+        f.write(report)
+
+    summary = {
+        'test_accuracy': metrics['accuracy'],
+        'test_precision': metrics['weighted']['precision'],
+        'test_recall': metrics['weighted']['recall'],
+        'test_f1_score': metrics['weighted']['f1']
+    }
+    print("\nTest Metrics:")
+    for key, value in summary.items():
+        print(f"{key}: {value:.4f}")
+    with open(output_dir / 'test_metrics.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    np.save(output_dir / 'confusion_matrix.npy', cm)
+
+    thread = plot_confusion_matrix(cm, class_names, str(output_dir / 'confusion_matrix.png'),
+                                   dpi) if plot else None
+    return summary, thread
+
+def _evaluate_shard(args):
+    """Evaluate one shard of image files with the deployed model (pool worker)
+
+    Returns a confusion matrix and the forward-pass seconds per resolution
+    (None = the service's full image size).
+    """
+    model_path, class_names_path, samples, threads, batch_size, resolutions = args
+    torch.set_num_threads(threads)
+
+    import api_service
+    api_service.device = torch.device('cpu')
+    # Same model wrapper as the service: uint8 NHWC in, normalization in-graph
+    net, names = api_service.load_model_bundle(model_path, class_names_path)
+    image_size = api_service.CONFIG['image_size']
+
+    cms = [torch.zeros(len(names), len(names), dtype=torch.int64) for _ in resolutions]
+    seconds = [0.0] * len(resolutions)
+    with torch.no_grad():
+        for start in range(0, len(samples), batch_size):
+            chunk = samples[start:start + batch_size]
+            batch = np.stack([decode_image(path, image_size) for path, _ in chunk])
+            labels = torch.tensor([label for _, label in chunk])
+            for i, resolution in enumerate(resolutions):
+                # Downscaled exactly as the service does under load
+                inputs = batch if resolution is None else api_service.resize_frames(batch, resolution)
+                tic = time.perf_counter()
+                outputs = net(torch.from_numpy(inputs))
+                seconds[i] += time.perf_counter() - tic
+                update_confusion(cms[i], labels, outputs.argmax(1))
+    return [cm.numpy() for cm in cms], seconds
+
+def _run_shards(model_path, class_names_path, data_dir, workers, batch_size, resolutions):
+    """Confusion matrices (and forward seconds) per resolution, summed over worker shards"""
+    with open(class_names_path, 'r') as f:
+        class_names = json.load(f)
+    class_to_idx = {name: i for i, name in enumerate(class_names)}
+    files = list_images([data_dir])
+    unknown = sorted({label for _, label in files if label not in class_to_idx})
+    if unknown:
+        raise ValueError(f"Folders not among the model's classes: {unknown}")
+    samples = [(path, class_to_idx[label]) for path, label in files]
+    print(f"Evaluating {model_path} on {len(samples)} images from {data_dir} "
+          f"({workers} worker{'s' if workers > 1 else ''})")
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    shards = [samples[i::workers] for i in range(workers)]
+    jobs = [(model_path, class_names_path, shard, threads, batch_size, resolutions)
+            for shard in shards if shard]
+    if workers == 1:
+        results = [_evaluate_shard(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+            results = list(pool.map(_evaluate_shard, jobs))
+    cms = [sum(result[0][i] for result in results) for i in range(len(resolutions))]
+    seconds = [sum(result[1][i] for result in results) for i in range(len(resolutions))]
+    return cms, seconds, class_names, len(samples)
+
+def evaluate_directory(model_path, class_names_path, data_dir, workers=1, batch_size=32):
+    """Confusion matrix of a deployed checkpoint on a class-per-folder directory
+
+    Folder names must match the model's class names. Samples are split into
+    `workers` shards evaluated in parallel processes, each with its share of cores.
+    """
+    cms, _, class_names, _ = _run_shards(model_path, class_names_path, data_dir,
+                                         workers, batch_size, [None])
+    return cms[0], class_names
+
+def evaluate_resolutions(model_path, class_names_path, data_dir, resolutions,
+                         workers=1, batch_size=32):
+    """Accuracy and forward time of a deployed checkpoint at several input resolutions
+
+    Images are decoded once at full size and downscaled per level as the
+    service does in adaptive mode. The first resolution is the reference for
+    `accuracy_drop`. Returns (report dict, confusion matrices, class names).
+    """
+    cms, seconds, class_names, total = _run_shards(model_path, class_names_path, data_dir,
+                                                   workers, batch_size, list(resolutions))
+    reference = None
+    report = {}
+    for resolution, cm, secs in zip(resolutions, cms, seconds):
+        metrics = compute_metrics(cm)
+        if reference is None:
+            reference = metrics
+        report[str(resolution)] = {
+            'accuracy': metrics['accuracy'],
+            'weighted_f1': metrics['weighted']['f1'],
+            'accuracy_drop': reference['accuracy'] - metrics['accuracy'],
+            'ms_per_image': secs * 1000 / max(total, 1)
+        }
+    return {'model': model_path, 'images': total, 'resolutions': report}, cms, class_names
+
+def main():
+    """Evaluate a deployed checkpoint from the command line"""
+    import api_service
+
+    parser = argparse.ArgumentParser(description="Evaluate a trained model on a held-out directory")
+    parser.add_argument('--data', required=True, help="Class-per-folder image directory")
+    parser.add_argument('--model', default=api_service.CONFIG['model_path'])
+    parser.add_argument('--class-names', default=api_service.CONFIG['class_names_path'])
+    parser.add_argument('--workers', type=int, default=1, help="Parallel evaluation processes")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output-dir', default='evaluation')
+    parser.add_argument('--no-plot', action='store_true', help="Skip the confusion matrix image")
+    parser.add_argument('--resolutions', type=int, nargs='+',
+                        help="Compare accuracy at these input sizes (full size first), "
+                             "e.g. 224 192 160; writes resolution_report.json")
+    args = parser.parse_args()
+
+    if args.resolutions:
+        report, _, _ = evaluate_resolutions(args.model, args.class_names, args.data,
+                                            args.resolutions, args.workers, args.batch_size)
+        print(f"\n{'resolution':>10} {'accuracy':>9} {'drop':>9} {'f1':>9} {'ms/image':>9}")
+        for resolution, row in report['resolutions'].items():
+            print(f"{resolution:>10} {row['accuracy']:>9.4f} {row['accuracy_drop']:>9.4f} "
+                  f"{row['weighted_f1']:>9.4f} {row['ms_per_image']:>9.2f}")
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+        path = Path(args.output_dir) / 'resolution_report.json'
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resolution report saved to: {path}")
+        return
+
+    cm, class_names = evaluate_directory(args.model, args.class_names, args.data,
+                                         args.workers, args.batch_size)
+    _, thread = save_report(cm, class_names, args.output_dir, plot=not args.no_plot)
+    if thread is not None:
+        thread.join()
+    print(f"Results saved to: {args.output_dir}/")
+
+if __name__ == "__main__":
+    main()
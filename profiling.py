@@ -0,0 +1,109 @@
+"""
+Training-loop instrumentation for Plant Disease training
+Times the forward, backward and optimizer phases of every step without forcing
+a host sync per step: on a GPU each phase boundary is a CUDA event, resolved
+only when `flush()` is called at a log interval; on CPU the phases are
+synchronous and timed with perf_counter. Also reports peak memory and can
+capture a torch.profiler trace for a window of steps.
+"""
+
+import sys
+import time
+import torch
+
+PHASES = ('forward', 'backward', 'optimizer')
+
+class StepProfiler:
+    """Per-phase step timing, peak memory and an optional torch.profiler window
+
+    In the training loop call `start_step()` once the batch is on hand, `mark()`
+    after the forward and backward passes, and `end_step()` after the optimizer.
+    `trace_steps=(start, end)` traces global steps start <= step < end.
+    """
+    def __init__(self, device, trace_steps=None, trace_dir='profiler_traces'):
+        self.cuda = device.type == 'cuda'
+        self.trace_steps = trace_steps
+        self.trace_dir = trace_dir
+        self.global_step = 0
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self._marks = []
+        self._pending = []
+        self._trace = None
+
+    def _now(self):
+        if self.cuda:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def start_step(self):
+        if self.trace_steps and self.global_step == self.trace_steps[0]:
+            self._start_trace()
+        self._marks = [self._now()]
+
+    def mark(self):
+        self._marks.append(self._now())
+
+    def end_step(self):
+        self._marks.append(self._now())
+        self._pending.append(self._marks)
+        self.global_step += 1
+        if self._trace is not None:
+            self._trace.step()
+            if self.global_step >= self.trace_steps[1]:
+                self._stop_trace()
+
+    def flush(self):
+        """Add the recorded steps to the phase totals (one device sync on GPU)"""
+        if not self._pending:
+            return
+        if self.cuda:
+            self._pending[-1][-1].synchronize()
+        for marks in self._pending:
+            for phase, start, end in zip(PHASES, marks, marks[1:]):
+                if self.cuda:
+                    self.totals[phase] += start.elapsed_time(end) / 1000
+                else:
+                    self.totals[phase] += end - start
+        self._pending = []
+
+    def reset(self):
+        """Start a new epoch: clear the phase totals and the peak memory counter"""
+        self.flush()
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        if self.cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+    def peak_memory_mb(self):
+        """Peak allocated device memory on GPU, peak process RSS on CPU (None if unknown)"""
+        if self.cuda:
+            return torch.cuda.max_memory_allocated() / 2**20
+        try:
+            import resource
+        except ImportError:
+            # Not available on Windows
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes on Linux
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+    def _start_trace(self):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.cuda:
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._trace = torch.profiler.profile(
+            activities=activities,
+            record_shapes=True,
+            profile_memory=True,
+            on_trace_ready=torch.profiler.tensorboard_trace_handler(self.trace_dir)
+        )
+        self._trace.start()
+        print(f"\ntorch.profiler: tracing steps {self.trace_steps[0]}-{self.trace_steps[1] - 1}")
+
+    def _stop_trace(self):
+        self._trace.stop()
+        sort_by = 'self_cuda_time_total' if self.cuda else 'self_cpu_time_total'
+        print(self._trace.key_averages().table(sort_by=sort_by, row_limit=15))
+        print(f"Trace saved to {self.trace_dir}/ (open with TensorBoard or chrome://tracing)")
+        self._trace = None
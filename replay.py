@@ -0,0 +1,65 @@
+"""
+Reservoir-sampled replay buffer for incremental fine-tuning
+Keeps a fixed-size, uniformly sampled subset of every training image seen so far
+(as source paths and class names), so `python train_model.py --mode incremental`
+can mix old data into updates on new uploads without revisiting the full dataset.
+Each path is offered at most once, however many updates see it.
+"""
+
+import json
+from pathlib import Path
+import numpy as np
+
+class ReplayBuffer:
+    """Fixed-capacity uniform sample of a stream of (path, class name) items (Algorithm R)"""
+    def __init__(self, capacity, seed=42):
+        self.capacity = capacity
+        self.items = []
+        self.seen = 0
+        self.offered = set()
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, items):
+        """Offer items to the reservoir; each item seen so far is kept with equal probability
+
+        Paths offered before are ignored, so they are neither duplicated nor counted twice.
+        """
+        for item in items:
+            if item[0] in self.offered:
+                continue
+            self.offered.add(item[0])
+            self.seen += 1
+            if len(self.items) < self.capacity:
+                self.items.append(tuple(item))
+            else:
+                slot = self.rng.integers(self.seen)
+                if slot < self.capacity:
+                    self.items[slot] = tuple(item)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'capacity': self.capacity,
+                'seen': self.seen,
+                'items': self.items,
+                'offered': sorted(self.offered),
+                'rng_state': self.rng.bit_generator.state
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        """Buffer saved by `save`, or None if the file doesn't exist"""
+        if not Path(path).exists():
+            return None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        buffer = cls(data['capacity'])
+        buffer.seen = data['seen']
+        buffer.items = [tuple(item) for item in data['items']]
+        # Files saved before offers were tracked: at least the kept items were offered
+        buffer.offered = set(data.get('offered', [path for path, _ in buffer.items]))
+        buffer.rng.bit_generator.state = data['rng_state']
+        return buffer
@@ -0,0 +1,191 @@
+"""
+Multi-worker launcher for the Plant Disease Detection API
+Loads and freezes the model once in the parent process, then forks the uvicorn
+workers so they share the weights (and the torch/timm/cv2 import graph)
+copy-on-write instead of each loading its own copy.
+
+Linux/macOS only (uses os.fork). Serves on CPU. The memory report reads
+/proc and is skipped on macOS.
+
+/admin/reload and the model file watcher run inside whichever worker handles
+them: only that worker swaps models, and its new weights are a private copy.
+To roll out a new model to every worker, restart serve.py.
+
+Usage:
+    python serve.py --workers 4
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+from pathlib import Path
+import uvicorn
+import torch
+
+import api_service
+
+# Configuration
+CONFIG = {
+    'host': '0.0.0.0',
+    'port': 5000,
+    'workers': 2,
+    'report_after': 60,  # Seconds after start to print the memory report
+    'report_path': 'worker_memory.json'
+}
+
+def freeze_model(net: torch.nn.Module):
+    """Make the weights read-only shared memory so workers never copy them"""
+    net.eval()
+    for param in net.parameters():
+        param.requires_grad_(False)
+    # Shared mappings stay shared even if a worker touches the pages
+    net.share_memory()
+
+def preload():
+    """Load model, class names and label encoder into api_service before forking"""
+    # The parent never runs inference; keep it from starting an OpenMP pool
+    # that the forked workers would inherit in a broken state
+    torch.set_num_threads(1)
+
+    api_service.load_artifacts(torch.device('cpu'))
+    freeze_model(api_service.model)
+
+    # Move everything allocated so far out of the collector's reach, so the
+    # workers' GC passes don't write to (and un-share) the parent's objects
+    gc.collect()
+    gc.freeze()
+
+def bind_socket(host, port):
+    """Listening socket shared by all workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(worker_index, num_workers, sock):
+    """Serve the app on the shared socket in a forked worker"""
+    os.environ['WORKER_INDEX'] = str(worker_index)
+    # The parent's single thread is inherited; give each worker its share of
+    # the cores (a runtime profile, if present, overrides this at startup)
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    torch.set_num_threads(max(1, cores // num_workers))
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    config = uvicorn.Config(api_service.app, log_level="info")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+def read_memory(pid):
+    """RSS, PSS and shared/private memory (MB) for a process from /proc"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+
+    return {
+        'rss_mb': round(fields.get('Rss', 0), 1),
+        'pss_mb': round(fields.get('Pss', 0), 1),
+        'shared_mb': round(fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0), 1),
+        'private_mb': round(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), 1)
+    }
+
+def memory_report(parent_pid, worker_pids):
+    """Print and save shared vs private memory for the parent and each worker
+
+    Returns None where /proc/<pid>/smaps_rollup isn't available (e.g. macOS).
+    """
+    if not Path(f'/proc/{parent_pid}/smaps_rollup').exists():
+        print("Memory report needs /proc/<pid>/smaps_rollup (Linux); skipping")
+        return None
+    report = {'parent': {'pid': parent_pid, **read_memory(parent_pid)}, 'workers': []}
+    for index, pid in enumerate(worker_pids):
+        try:
+            report['workers'].append({'worker': index, 'pid': pid, **read_memory(pid)})
+        except FileNotFoundError:
+            continue
+
+    print("=" * 60)
+    print("Memory per process (MB)")
+    print(f"{'process':<10}{'pid':>8}{'rss':>10}{'pss':>10}{'shared':>10}{'private':>10}")
+    rows = [('parent', report['parent'])] + [(f"worker {w['worker']}", w) for w in report['workers']]
+    for name, m in rows:
+        print(f"{name:<10}{m['pid']:>8}{m['rss_mb']:>10}{m['pss_mb']:>10}"
+              f"{m['shared_mb']:>10}{m['private_mb']:>10}")
+    total_pss = report['parent']['pss_mb'] + sum(w['pss_mb'] for w in report['workers'])
+    print(f"Total PSS (actual RAM used by all processes): {total_pss:.1f} MB")
+    print("=" * 60)
+
+    with open(CONFIG['report_path'], 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def main():
+    """Preload the model, fork workers and supervise them"""
+    if not hasattr(os, 'fork'):
+        sys.exit("serve.py needs os.fork; use 'python api_service.py' on this platform")
+
+    profile = api_service.load_runtime_profile()
+    parser = argparse.ArgumentParser(description="Serve the API with workers sharing one model copy")
+    parser.add_argument('--workers', type=int,
+                        default=profile['workers'] if profile else CONFIG['workers'])
+    parser.add_argument('--host', default=CONFIG['host'])
+    parser.add_argument('--port', type=int, default=CONFIG['port'])
+    parser.add_argument('--report-after', type=float, default=CONFIG['report_after'])
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Preloading model for {args.workers} workers")
+    print("=" * 60)
+    preload()
+    sock = bind_socket(args.host, args.port)
+
+    worker_pids = []
+    for index in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(index, args.workers, sock)
+            os._exit(0)
+        worker_pids.append(pid)
+    print(f"✓ Started {len(worker_pids)} workers on {args.host}:{args.port}: {worker_pids}")
+
+    def shutdown(signum, frame):
+        for pid in worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    # kill -USR1 <parent pid> prints a fresh memory report
+    signal.signal(signal.SIGUSR1, lambda signum, frame: memory_report(os.getpid(), worker_pids))
+
+    reported = args.report_after <= 0
+    start = time.time()
+    alive = set(worker_pids)
+    while alive:
+        if not reported and time.time() - start >= args.report_after:
+            memory_report(os.getpid(), worker_pids)
+            reported = True
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            alive.discard(pid)
+        else:
+            time.sleep(0.5)
+
+    print("All workers stopped")
+
+if __name__ == "__main__":
+    main()
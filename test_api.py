@@ -4,6 +4,8 @@ Test script for the Plant Disease Detection API
 
 import requests
 import json
+import cv2
+import numpy as np
 from pathlib import Path
 
 # API base URL
@@ -17,6 +19,17 @@ def test_health():
     print(f"Response: {json.dumps(response.json(), indent=2)}")
     print("-" * 60)
 
+def test_probes():
+    """Test liveness and readiness endpoints"""
+    print("Testing /live and /ready endpoints...")
+    response = requests.get(f"{BASE_URL}/live")
+    print(f"/live status: {response.status_code}")
+    response = requests.get(f"{BASE_URL}/ready")
+    print(f"/ready status: {response.status_code}")
+    data = response.json()
+    print(f"Warm-up: {data.get('warmup_status')} ({data.get('warmup_total_ms', 0):.0f} ms)")
+    print("-" * 60)
+
 def test_classes():
     """Test classes endpoint"""
     print("Testing /classes endpoint...")
@@ -55,6 +68,57 @@ def test_predict(image_path):
     
     print("-" * 60)
 
+def test_retake():
+    """Test that the quality gate answers an unusable photo with a retake response"""
+    print("Testing /predict retake response with a dark, featureless image...")
+    
+    ok, image = cv2.imencode('.jpg', np.full((224, 224, 3), 5, dtype=np.uint8))
+    files = {'file': ('dark.jpg', image.tobytes(), 'image/jpeg')}
+    response = requests.post(f"{BASE_URL}/predict", files=files)
+    
+    print(f"Status: {response.status_code}")
+    data = response.json()
+    assert response.status_code == 200, response.text
+    assert data.get('success') is False and data.get('retake') is True, data
+    print(f"Reasons: {data.get('reasons')}")
+    print(f"Hints: {data.get('hints')}")
+    print("-" * 60)
+
+def test_predict_gate_off(image_path):
+    """Test a prediction with the quality gate (and explanations) turned off
+    
+    Runs the app in-process, since CONFIG can't be changed on a running server.
+    """
+    print("Testing /predict in-process with CONFIG['quality_gate'] = False...")
+    from fastapi.testclient import TestClient
+    import api_service
+    
+    api_service.CONFIG['quality_gate'] = False
+    api_service.CONFIG['explain_enabled'] = False
+    with TestClient(api_service.app) as client:
+        with open(image_path, 'rb') as f:
+            response = client.post("/predict", files={'file': (Path(image_path).name, f, 'image/jpeg')})
+    
+    print(f"Status: {response.status_code}")
+    data = response.json()
+    assert response.status_code == 200, response.text
+    assert data['success'] and data['quality'] is None and data['upload_id'] is None, data
+    print(f"Prediction: {data['prediction']} ({data['confidence']:.4f})")
+    print("-" * 60)
+
+def test_metrics():
+    """Test metrics endpoint"""
+    print("Testing /metrics endpoint...")
+    response = requests.get(f"{BASE_URL}/metrics")
+    print(f"Status: {response.status_code}")
+    data = response.json()
+    gate = data.get('quality_gate', {})
+    print(f"Quality gate: checked {gate.get('checked')}, rejected {gate.get('rejected')} "
+          f"{gate.get('reasons')}")
+    for lane, stats in data.get('scheduler', {}).get('lanes', {}).items():
+        print(f"Lane {lane}: completed {stats['completed']}, latency {stats['latency_ms']}")
+    print("-" * 60)
+
 def test_batch_predict(image_paths):
     """Test batch prediction endpoint"""
     print(f"Testing /predict/batch endpoint with {len(image_paths)} images")
@@ -105,6 +169,12 @@ def main():
         print("Make sure the API is running: python api_service.py")
         return
     
+    # Test probes
+    try:
+        test_probes()
+    except Exception as e:
+        print(f"Probe test failed: {e}")
+    
     # Test classes
     try:
         test_classes()
@@ -133,6 +203,24 @@ def main():
         except Exception as e:
             print(f"Batch prediction test failed: {e}")
     
+    # Test quality gate
+    try:
+        test_retake()
+    except Exception as e:
+        print(f"Retake test failed: {e}")
+    
+    if Path(test_image).exists():
+        try:
+            test_predict_gate_off(test_image)
+        except Exception as e:
+            print(f"Gate-off prediction test failed: {e}")
+    
+    # Test metrics
+    try:
+        test_metrics()
+    except Exception as e:
+        print(f"Metrics test failed: {e}")
+    
     print("\n" + "=" * 60)
     print("Test Suite Complete")
     print("=" * 60)
@@ -0,0 +1,153 @@
+"""
+Test script for the pure helpers behind training, evaluation and serving
+Checks them against reference implementations; no server, dataset or trained
+model needed.
+
+Usage:
+    python test_components.py
+"""
+
+import tempfile
+from pathlib import Path
+import numpy as np
+import torch
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support, classification_report
+
+from evaluation import update_confusion, compute_metrics, format_report
+from api_service import NormalizedInput, IMAGENET_MEAN, IMAGENET_STD
+from replay import ReplayBuffer
+from train_model import ResumableSampler
+
+def test_metrics():
+    """compute_metrics / format_report against sklearn on random predictions"""
+    print("Testing compute_metrics and format_report against sklearn...")
+    rng = np.random.default_rng(0)
+    num_classes = 7
+    labels = rng.integers(0, num_classes, 500)
+    # The last class is never predicted, to exercise zero_division
+    preds = np.where(rng.random(500) < 0.6, labels, rng.integers(0, num_classes - 1, 500))
+    preds = np.where(preds == num_classes - 1, 0, preds)
+
+    cm = torch.zeros(num_classes, num_classes, dtype=torch.int64)
+    for start in range(0, 500, 64):
+        update_confusion(cm, torch.from_numpy(labels[start:start + 64]),
+                         torch.from_numpy(preds[start:start + 64]))
+    expected_cm = confusion_matrix(labels, preds, labels=range(num_classes))
+    assert np.array_equal(cm.numpy(), expected_cm)
+
+    metrics = compute_metrics(cm.numpy())
+    assert np.isclose(metrics['accuracy'], (labels == preds).mean())
+    precision, recall, f1, support = precision_recall_fscore_support(
+        labels, preds, labels=range(num_classes), zero_division=0)
+    assert np.allclose(metrics['precision'], precision)
+    assert np.allclose(metrics['recall'], recall)
+    assert np.allclose(metrics['f1'], f1)
+    assert np.array_equal(metrics['support'], support)
+    for average in ('macro', 'weighted'):
+        p, r, f, _ = precision_recall_fscore_support(labels, preds, labels=range(num_classes),
+                                                     average=average, zero_division=0)
+        assert np.allclose([metrics[average]['precision'], metrics[average]['recall'],
+                            metrics[average]['f1']], [p, r, f])
+
+    # Same rows and numbers as sklearn (column spacing differs)
+    names = [f"class_{i}" for i in range(num_classes)]
+    expected = classification_report(labels, preds, labels=range(num_classes), target_names=names,
+                                     digits=4, zero_division=0)
+    tokens = lambda text: [line.split() for line in text.splitlines() if line.strip()]
+    assert tokens(format_report(metrics, names)) == tokens(expected)
+    print("✓ Confusion matrix, metrics and report match sklearn")
+    print("-" * 60)
+
+def test_normalized_input():
+    """In-graph normalization against the old per-request (x/255 - mean)/std path"""
+    print("Testing NormalizedInput.normalize against host-side normalization...")
+    images = torch.randint(0, 256, (4, 32, 48, 3), dtype=torch.uint8)
+
+    mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+    expected = (images.permute(0, 3, 1, 2).float() / 255.0 - mean) / std
+
+    wrapped = NormalizedInput(torch.nn.Identity())
+    normalized = wrapped.normalize(images)
+    assert normalized.shape == expected.shape
+    assert torch.allclose(normalized, expected, atol=1e-5)
+    assert torch.allclose(wrapped(images), expected, atol=1e-5)
+    print(f"✓ Max difference {(normalized - expected).abs().max().item():.2e}")
+    print("-" * 60)
+
+def test_replay_buffer():
+    """ReplayBuffer save/load keeps items, counters and the sampling stream"""
+    print("Testing ReplayBuffer save/load round-trip...")
+    buffer = ReplayBuffer(capacity=10, seed=3)
+    buffer.add((f"images/{i}.jpg", f"class_{i % 3}") for i in range(50))
+    buffer.add([("images/0.jpg", "class_0")])  # Already offered: ignored
+    assert len(buffer) == 10 and buffer.seen == 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'replay_buffer.json'
+        buffer.save(path)
+        loaded = ReplayBuffer.load(path)
+        assert ReplayBuffer.load(Path(tmp) / 'missing.json') is None
+
+    assert loaded.items == buffer.items
+    assert loaded.seen == buffer.seen and loaded.offered == buffer.offered
+    # Both continue identically after the round-trip
+    more = [(f"uploads/{i}.jpg", "class_1") for i in range(30)]
+    buffer.add(more)
+    loaded.add(more)
+    assert loaded.items == buffer.items
+    print(f"✓ {len(loaded)} items, {loaded.seen} seen, sampling resumes identically")
+    print("-" * 60)
+
+def test_resumable_sampler():
+    """ResumableSampler resumed mid-epoch continues the same order"""
+    print("Testing ResumableSampler mid-epoch resume...")
+    batch_size = 8
+    for world_size in (1, 2):
+        for rank in range(world_size):
+            full = ResumableSampler(101, batch_size, seed=42, rank=rank, world_size=world_size)
+            full.set_epoch(3)
+            order = list(full)
+
+            resumed = ResumableSampler(101, batch_size, seed=42, rank=rank, world_size=world_size)
+            resumed.set_epoch(3, start_batch=5)
+            assert list(resumed) == order[5 * batch_size:]
+            assert len(resumed) == len(order) - 5 * batch_size
+
+        if world_size == 2:
+            shards = []
+            for rank in range(world_size):
+                sampler = ResumableSampler(101, batch_size, seed=42, rank=rank, world_size=world_size)
+                sampler.set_epoch(3)
+                shards.append(list(sampler))
+            assert len(shards[0]) == len(shards[1])
+            assert set(shards[0]) | set(shards[1]) == set(range(101))
+
+    # Each epoch reshuffles
+    epochs = []
+    for epoch in (3, 4):
+        sampler = ResumableSampler(101, batch_size, seed=42)
+        sampler.set_epoch(epoch)
+        epochs.append(list(sampler))
+    assert epochs[0] != epochs[1] and sorted(epochs[0]) == sorted(epochs[1])
+    print("✓ Resumed order matches the uninterrupted epoch (1 and 2 ranks)")
+    print("-" * 60)
+
+def main():
+    """Run all component checks"""
+    print("=" * 60)
+    print("Plant Disease Detection - Component Tests")
+    print("=" * 60)
+    print()
+
+    test_metrics()
+    test_normalized_input()
+    test_replay_buffer()
+    test_resumable_sampler()
+
+    print("\n" + "=" * 60)
+    print("All component tests passed")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,36 @@ Dataset: PlantVillage (https://www.kaggle.com/datasets/emmarex/plantdisease)
 """
 
 import os
+import sys
+import copy
+import time
+import random
+import hashlib
+import argparse
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Dataset, DataLoader, ConcatDataset
+from torch.utils.data.distributed import DistributedSampler
 import timm
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score, precision_score, recall_score, f1_score
 import matplotlib.pyplot as plt
-import seaborn as sns
 import joblib
 import json
 from pathlib import Path
-import cv2
 from tqdm import tqdm
+from dataset_cache import ImageCache, ImageFiles, build_cache
+from augment import BatchAugment
+from checkpointing import AsyncCheckpointer, latest_checkpoint
+from compression import prune_to_budget, prepare_qat, convert_qat, export_torchscript
+from evaluation import evaluate, save_report
+from profiling import StepProfiler
+from replay import ReplayBuffer
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -29,14 +43,72 @@ CONFIG = {
     'image_size': (224, 224),
     'batch_size': 32,
     'epochs': 50,
+    'early_stopping_patience': 10,  # Epochs without val loss improvement before stopping (0 disables)
+    'early_stopping_min_delta': 0.001,
+    'resolution_schedule': [(5, 128), (10, 160)],  # (until epoch, size); full image_size afterwards
+    'target_val_acc': 95.0,  # Report wall-clock time to reach this validation accuracy
     'learning_rate': 0.001,
     'validation_split': 0.2,
     'test_split': 0.1,
     'model_save_path': 'efficientnet_plant_disease.pth',
     'label_encoder_path': 'label_encoder.pkl',
     'class_names_path': 'class_names.json',
+    'cache_dir': 'dataset_cache',  # Memory-mapped decoded images (built once by dataset_cache.py)
+    'cache_shard_size': 4096,
+    'extra_dataset_paths': [],  # More class-per-folder dirs, e.g. confirmed field uploads
+    'ingest_workers': None,  # Processes for decoding new images (None = all cores)
+    'data_source': 'cache',  # 'cache' (memory-mapped) or 'files' (decode on demand)
     'random_seed': 42,
-    'num_workers': 0,  # Set to 0 for Windows compatibility
+    'num_workers': None,  # DataLoader workers (None = chosen per platform)
+    'prefetch_factor': 4,
+    'channels_last': False,  # NHWC memory format for model and batches
+    'precision': 'auto',  # 'fp32', 'bf16' (CPU/GPU autocast), 'fp16' (GPU + grad scaler) or 'auto'
+    'compare_fp32': True,  # Also validate in fp32 each epoch to log the accuracy difference
+    'scaling_report_path': 'scaling_report.json',  # Throughput per world size (torchrun runs)
+    'checkpoint_dir': 'checkpoints',  # Full training state for --resume
+    'checkpoint_every_steps': 500,  # Also saved at the end of every epoch
+    'checkpoint_keep': 3,
+    'feature_cache_dir': 'feature_cache',  # Pooled backbone features for --mode head-only
+    'head_backbone_path': 'efficientnet_plant_disease.pth',  # Backbone to freeze (ImageNet if missing)
+    'head_epochs': 30,
+    'head_learning_rate': 0.001,
+    'head_batch_size': 256,
+    'model_arch': 'efficientnet_b3',  # timm architecture; stored in checkpoints as 'arch'
+    'distill_teacher_path': 'efficientnet_plant_disease.pth',
+    'distill_student_arch': 'efficientnet_b0',  # e.g. 'mobilenetv3_small_100'
+    'distill_save_path': 'student_plant_disease.pth',
+    'distill_cache_dir': 'distill_cache',  # Teacher logits for --mode distill
+    'distill_temperature': 4.0,
+    'distill_alpha': 0.7,  # Weight of the soft-target loss vs the hard-label loss
+    'distill_epochs': 30,
+    'distill_report_path': 'distillation_report.json',
+    'latency_batch_sizes': [1, 4, 8, 16],  # CPU batch sizes timed in distillation/compression reports
+    'compression': 'prune+qat',  # --mode compress: 'prune', 'qat' or 'prune+qat'
+    'compress_after_training': False,  # Run the compression stage right after full training
+    'flop_budget': 0.5,  # Pruned model FLOPs as a fraction of the original
+    'compress_epochs': 5,  # Fine-tuning epochs after pruning and for QAT
+    'compress_learning_rate': 0.0001,
+    'compressed_model_path': 'plant_disease_compressed.torchscript',
+    'compression_report_path': 'compression_report.json',
+    'plot_confusion_matrix': True,  # Rendered on a background thread after evaluation
+    'confusion_matrix_dpi': 120,
+    'data_budget': 1.0,  # Fraction of training samples per epoch; < 1 samples harder examples more
+    'prune_warmup_epochs': 1,  # Full epochs before pruning (every sample needs a loss first)
+    'prune_loss_ema': 0.7,  # Weight of the previous per-sample loss average
+    'prune_min_weight': 0.1,  # Sampling weight floor so easy samples are still revisited
+    'data_budget_report_path': 'data_budget_report.json',  # Val acc vs wall-clock time per budget
+    'confirmed_uploads_path': 'confirmed_uploads',  # Class-per-folder farmer-confirmed images
+    'replay_buffer_size': 2000,  # Original training images mixed into incremental updates
+    'replay_buffer_path': 'replay_buffer.json',
+    'incremental_epochs': 3,  # Passes over new images + replay buffer
+    'incremental_learning_rate': 0.0001,
+    'incremental_val_split': 0.2,  # Held-out share of the new images
+    'incremental_val_samples': 2000,  # Original validation images checked for forgetting
+    'model_versions_dir': 'models',  # Versioned checkpoints from incremental updates
+    'log_every_steps': 20,  # Host sync interval for progress-bar loss/acc/img/s
+    'profile_steps': None,  # e.g. (20, 30): torch.profiler trace of those global steps
+    'profile_dir': 'profiler_traces',
+    'augment': True,  # Batch augmentation (flips, rot90, crops, jitter, mixup/cutmix); see augment.py
     'device': 'cuda' if torch.cuda.is_available() else 'cpu'
 }
 
@@ -46,59 +118,318 @@ torch.manual_seed(CONFIG['random_seed'])
 if torch.cuda.is_available():
     torch.cuda.manual_seed(CONFIG['random_seed'])
 
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+class BatchTransform:
+    """Move a collated uint8 batch to the device and normalize it in one vectorized op
+    
+    Samples stay uint8 through the DataLoader (4x less worker IPC than float32);
+    the ImageNet mean/std tensors are built once instead of per sample. An optional
+    BatchAugment runs on the uint8 batch before normalization. Setting
+    `resolution` downscales batches on the device (progressive resizing), so
+    the cached full-size images never need re-decoding.
+    """
+    def __init__(self, device, channels_last=False, augment=None):
+        self.device = device
+        self.channels_last = channels_last
+        self.augment = augment
+        self.resolution = None
+        # Scaled by 255 so (x - mean) / std works directly on 0-255 values
+        self.mean = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1) * 255.0
+        self.std = torch.tensor(IMAGENET_STD, device=device).view(1, 3, 1, 1) * 255.0
+    
+    def __call__(self, images):
+        images = images.to(self.device, non_blocking=True)
+        if images.dtype != torch.uint8:
+            # Already normalized by a per-sample transform
+            return images
+        if self.resolution is not None and images.shape[-1] != self.resolution:
+            images = F.interpolate(images.float(), size=(self.resolution, self.resolution),
+                                   mode='bilinear', antialias=True, align_corners=False)
+        images = self.augment(images) if self.augment is not None else images.float()
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        return images.sub_(self.mean).div_(self.std)
+
+class PrecisionMode:
+    """Autocast dtype and grad scaler for fp32 / bf16 / fp16 training"""
+    def __init__(self, mode, device):
+        if mode == 'auto':
+            if device.type == 'cuda':
+                mode = 'fp16'
+            elif getattr(torch.cpu, '_is_avx512_bf16_supported', lambda: False)():
+                mode = 'bf16'
+            else:
+                mode = 'fp32'
+        if mode == 'fp16' and device.type != 'cuda':
+            print("fp16 needs a GPU, using bf16 autocast on CPU instead")
+            mode = 'bf16'
+        
+        self.mode = mode
+        self.device_type = device.type
+        self.dtype = {'bf16': torch.bfloat16, 'fp16': torch.float16}.get(mode)
+        self.scaler = torch.amp.GradScaler('cuda', enabled=mode == 'fp16')
+    
+    def autocast(self):
+        """Context manager for the forward pass (a no-op in fp32)"""
+        return torch.autocast(device_type=self.device_type, dtype=self.dtype,
+                              enabled=self.dtype is not None)
+
+FP32 = PrecisionMode('fp32', torch.device('cpu'))
+
+def setup_distributed():
+    """Join the process group when launched by torchrun; returns (rank, world_size)"""
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    if world_size <= 1:
+        return 0, 1
+    
+    if CONFIG['device'] == 'cuda':
+        torch.cuda.set_device(int(os.environ['LOCAL_RANK']))
+        dist.init_process_group(backend='nccl')
+    else:
+        dist.init_process_group(backend='gloo')
+    return dist.get_rank(), world_size
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+def is_main_process():
+    """Rank 0 (or the only process) does all file writes"""
+    return not is_distributed() or dist.get_rank() == 0
+
+def reduce_sums(*values):
+    """Sum scalar metrics across ranks (no-op when not distributed)"""
+    if not is_distributed():
+        return values
+    device = 'cuda' if dist.get_backend() == 'nccl' else 'cpu'
+    totals = torch.tensor(values, dtype=torch.float64, device=device)
+    dist.all_reduce(totals)
+    return totals.tolist()
+
+class ResumableSampler(torch.utils.data.Sampler):
+    """Seeded per-epoch shuffle that can start part-way through an epoch
+    
+    With world_size > 1 every rank draws the same permutation and takes its
+    own strided shard, padded so all ranks run the same number of steps.
+    """
+    def __init__(self, num_samples, batch_size, seed, rank=0, world_size=1):
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        self.start_batch = 0
+    
+    def set_epoch(self, epoch, start_batch=0):
+        self.epoch = epoch
+        self.start_batch = start_batch
+    
+    @property
+    def shard_size(self):
+        return -(-self.epoch_size() // self.world_size)
+    
+    def epoch_size(self):
+        """Samples drawn per epoch (across all ranks)"""
+        return self.num_samples
+    
+    def _permutation(self, generator):
+        return torch.randperm(self.num_samples, generator=generator)
+    
+    def _order(self):
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        order = self._permutation(generator)
+        padding = self.shard_size * self.world_size - len(order)
+        if padding:
+            order = torch.cat([order, order[:padding]])
+        return order[self.rank::self.world_size]
+    
+    def __iter__(self):
+        return iter(self._order()[self.start_batch * self.batch_size:].tolist())
+    
+    def __len__(self):
+        return max(0, self.shard_size - self.start_batch * self.batch_size)
+
+class LossWeightedSampler(ResumableSampler):
+    """ResumableSampler that spends each epoch's data budget on the harder samples
+    
+    Tracks an exponential moving average of every training sample's loss (one
+    float per dataset position, on the device). After `warmup_epochs` full
+    epochs, each epoch draws `budget` x the samples without replacement, with
+    probability proportional to the relative loss plus `min_weight`, so
+    consistently easy samples are down-weighted but still revisited.
+    
+    Losses are summed during the epoch and folded into the average (summed
+    across ranks) by `finish_epoch()`, so the draw for an epoch depends only on
+    state at its start and resumes exactly.
+    """
+    def __init__(self, num_samples, batch_size, seed, device, budget, warmup_epochs=1,
+                 ema=0.7, min_weight=0.1, rank=0, world_size=1):
+        super().__init__(num_samples, batch_size, seed, rank, world_size)
+        self.device = device
+        self.budget = budget
+        self.warmup_epochs = warmup_epochs
+        self.ema = ema
+        self.min_weight = min_weight
+        self.losses = torch.full((num_samples,), float('nan'), device=device)
+        self.epoch_sum = torch.zeros(num_samples, device=device)
+        self.epoch_count = torch.zeros(num_samples, device=device)
+        self._batch_order = None
+    
+    def pruning(self):
+        return self.budget < 1.0 and self.epoch >= self.warmup_epochs
+    
+    def epoch_size(self):
+        if not self.pruning():
+            return self.num_samples
+        return max(self.batch_size, int(self.num_samples * self.budget))
+    
+    def sampling_weights(self):
+        """Relative loss plus a floor; samples without a loss yet get the top weight"""
+        if torch.isnan(self.losses).all():
+            return torch.ones(self.num_samples)
+        weights = self.losses / torch.nanmean(self.losses).clamp_min(1e-8) + self.min_weight
+        return torch.nan_to_num(weights, nan=float(torch.nan_to_num(weights, nan=0).max())).cpu()
+    
+    def _permutation(self, generator):
+        if not self.pruning():
+            return super()._permutation(generator)
+        return torch.multinomial(self.sampling_weights(), self.epoch_size(), replacement=False,
+                                 generator=generator)
+    
+    def __iter__(self):
+        order = self._order()
+        self._batch_order = order.to(self.device)
+        return iter(order[self.start_batch * self.batch_size:].tolist())
+    
+    def record(self, step, losses):
+        """Add per-sample losses of batch `step` (1-based within the epoch)"""
+        start = (step - 1) * self.batch_size
+        idx = self._batch_order[start:start + len(losses)]
+        self.epoch_sum.index_add_(0, idx, losses.float())
+        self.epoch_count.index_add_(0, idx, torch.ones_like(losses, dtype=torch.float32))
+    
+    def finish_epoch(self):
+        """Fold this epoch's losses into the moving average"""
+        if is_distributed():
+            dist.all_reduce(self.epoch_sum)
+            dist.all_reduce(self.epoch_count)
+        seen = self.epoch_count > 0
+        mean = self.epoch_sum / self.epoch_count.clamp_min(1)
+        blended = torch.where(torch.isnan(self.losses), mean,
+                              self.ema * self.losses + (1 - self.ema) * mean)
+        self.losses = torch.where(seen, blended, self.losses)
+        self.clear_epoch()
+    
+    def clear_epoch(self):
+        """Drop the partial sums of the current epoch"""
+        self.epoch_sum.zero_()
+        self.epoch_count.zero_()
+    
+    def state_dict(self):
+        return {'losses': self.losses.cpu(), 'epoch_sum': self.epoch_sum.cpu(),
+                'epoch_count': self.epoch_count.cpu()}
+    
+    def load_state_dict(self, state):
+        self.losses = state['losses'].to(self.device)
+        self.epoch_sum = state['epoch_sum'].to(self.device)
+        self.epoch_count = state['epoch_count'].to(self.device)
+
+def capture_rng_state(augment=None):
+    """All RNG states needed to resume a run exactly"""
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'augment': augment.rng.bit_generator.state if augment is not None else None
+    }
+    return state
+
+def restore_rng_state(state, augment=None):
+    """Restore RNG states saved by capture_rng_state"""
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    if augment is not None and state['augment'] is not None:
+        augment.rng.bit_generator.state = state['augment']
+
+def reseed_rank(rank, epoch, step, augment=None):
+    """Fresh per-rank RNG streams after resuming a distributed run
+    
+    Checkpoints only hold rank 0's RNG state; other ranks derive their own
+    from (seed, rank, epoch, step) so they keep drawing different augmentations.
+    """
+    seeds = np.random.SeedSequence([CONFIG['random_seed'], rank, epoch, step])
+    seed = int(seeds.generate_state(1)[0])
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    if augment is not None:
+        augment.rng = np.random.default_rng(seeds.spawn(1)[0])
+
 class PlantDiseaseDataset(Dataset):
-    """Custom Dataset for Plant Disease Images"""
-    def __init__(self, images, labels, transform=None):
+    """Custom Dataset for Plant Disease Images
+    
+    `images` can be an in-memory array or an ImageCache; `indices` selects the
+    subset of samples (e.g. one split) this dataset exposes. Without a transform,
+    samples are returned as uint8 CHW tensors; normalize batches with BatchTransform.
+    """
+    def __init__(self, images, labels, transform=None, indices=None):
         self.images = images
         self.labels = labels
         self.transform = transform
+        self.indices = indices
     
     def __len__(self):
-        return len(self.images)
+        return len(self.indices) if self.indices is not None else len(self.images)
     
     def __getitem__(self, idx):
+        if self.indices is not None:
+            idx = self.indices[idx]
         image = self.images[idx]
         label = self.labels[idx]
         
+        # Memory-mapped rows are read-only; torch needs a writable buffer
+        if not image.flags.writeable:
+            image = np.array(image)
+        
         if self.transform:
             image = self.transform(image)
         else:
-            # Convert to tensor and normalize
-            image = torch.from_numpy(image).permute(2, 0, 1).float() / 255.0
-            # Normalize with ImageNet stats
-            mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
-            std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
-            image = (image - mean) / std
+            # Keep uint8; the collated batch is normalized on the device
+            image = torch.from_numpy(image).permute(2, 0, 1)
         
         return image, label
 
 def load_dataset(dataset_path):
-    """Load images and labels from dataset directory"""
+    """Load images and labels from dataset directory
+    
+    Images are ingested in parallel into the memory-mapped cache; only files that
+    are new or changed since the last run are decoded. With data_source='files'
+    nothing is decoded up front and DataLoader workers decode on demand.
+    """
     print("Loading dataset...")
-    images = []
-    labels = []
-    
-    dataset_dir = Path(dataset_path)
-    if not dataset_dir.exists():
-        raise FileNotFoundError(f"Dataset directory not found: {dataset_path}")
-    
-    class_names = sorted([d.name for d in dataset_dir.iterdir() if d.is_dir()])
-    
-    for class_name in tqdm(class_names, desc="Loading classes"):
-        class_dir = dataset_dir / class_name
-        for img_path in class_dir.glob('*'):
-            if img_path.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                try:
-                    img = cv2.imread(str(img_path))
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    img = cv2.resize(img, CONFIG['image_size'])
-                    images.append(img)
-                    labels.append(class_name)
-                except Exception as e:
-                    print(f"Error loading {img_path}: {e}")
+    dataset_paths = [dataset_path] + CONFIG['extra_dataset_paths']
+    if CONFIG['data_source'] == 'files':
+        images = ImageFiles(dataset_paths, CONFIG['image_size'])
+    elif is_main_process():
+        images = build_cache(dataset_paths, CONFIG['cache_dir'], CONFIG['image_size'],
+                             CONFIG['cache_shard_size'], CONFIG['ingest_workers'])
+        if is_distributed():
+            dist.barrier()
+    else:
+        # Other ranks wait for rank 0 to update the cache, then just open it
+        dist.barrier()
+        images = ImageCache(CONFIG['cache_dir'])
+    class_names = images.class_names
+    labels = np.array(class_names)[images.labels]
     
     print(f"Loaded {len(images)} images from {len(class_names)} classes")
-    return np.array(images), np.array(labels), class_names
+    return images, labels, class_names
 
 def preprocess_data(images, labels, class_names):
     """Preprocess images and encode labels"""
@@ -109,9 +440,10 @@ def preprocess_data(images, labels, class_names):
     labels_encoded = label_encoder.fit_transform(labels)
     
     # Save label encoder and class names
-    joblib.dump(label_encoder, CONFIG['label_encoder_path'])
-    with open(CONFIG['class_names_path'], 'w') as f:
-        json.dump(class_names, f, indent=2)
+    if is_main_process():
+        joblib.dump(label_encoder, CONFIG['label_encoder_path'])
+        with open(CONFIG['class_names_path'], 'w') as f:
+            json.dump(class_names, f, indent=2)
     
     print(f"Classes: {len(class_names)}")
     return images, labels_encoded, label_encoder
@@ -139,65 +471,220 @@ def create_data_splits(images, labels):
     print(f"Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
     return X_train, X_val, X_test, y_train, y_val, y_test
 
-def create_model(num_classes):
-    """Create EfficientNet model using timm"""
-    print("Building EfficientNetB3 model...")
+def get_loader_settings():
+    """DataLoader worker settings for this platform"""
+    num_workers = CONFIG['num_workers']
+    if num_workers is None:
+        if sys.platform == 'win32':
+            # Spawned workers re-import the script; keep loading in-process
+            num_workers = 0
+        elif sys.platform == 'darwin':
+            num_workers = min(4, max(1, (os.cpu_count() or 1) // 2))
+        else:
+            num_workers = min(8, max(1, (os.cpu_count() or 1) - 1))
+    
+    settings = {'num_workers': num_workers, 'pin_memory': torch.cuda.is_available()}
+    if num_workers > 0:
+        settings['prefetch_factor'] = CONFIG['prefetch_factor']
+        settings['persistent_workers'] = True
+    return settings
+
+def create_model(num_classes, arch=None):
+    """Create an ImageNet-pretrained model using timm (CONFIG['model_arch'] by default)"""
+    arch = arch or CONFIG['model_arch']
+    print(f"Building {arch} model...")
     
-    # Load pre-trained EfficientNetB3
-    model = timm.create_model('efficientnet_b3', pretrained=True, num_classes=num_classes)
+    # Load pre-trained weights
+    model = timm.create_model(arch, pretrained=True, num_classes=num_classes)
     
     return model
 
-def train_epoch(model, dataloader, criterion, optimizer, device):
-    """Train for one epoch"""
+def train_epoch(model, dataloader, criterion, optimizer, device, batch_transform=None,
+                precision=None, start_step=0, on_step=None, profiler=None, loss_sampler=None):
+    """Train for one epoch, returning loss, accuracy and timing/throughput stats
+    
+    `start_step` is the batch the dataloader resumes from; `on_step(step)` is
+    called after every optimizer step (e.g. to checkpoint). Loss and accuracy
+    are accumulated on the device and only synced every CONFIG['log_every_steps'].
+    With a LossWeightedSampler, per-sample losses are recorded for data pruning.
+    """
     model.train()
-    running_loss = 0.0
-    correct = 0
+    batch_transform = batch_transform or BatchTransform(device)
+    precision = precision or FP32
+    profiler = profiler or StepProfiler(device)
+    profiler.reset()
+    running_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), dtype=torch.int64, device=device)
     total = 0
+    data_time = 0.0
+    compute_time = 0.0
+    log_every = CONFIG['log_every_steps']
     
-    pbar = tqdm(dataloader, desc='Training')
-    for images, labels in pbar:
-        images, labels = images.to(device), labels.to(device)
+    pbar = tqdm(dataloader, desc='Training', disable=not is_main_process())
+    step_start = time.perf_counter()
+    log_start, log_images = step_start, 0
+    for step, (images, labels) in enumerate(pbar, start=start_step + 1):
+        data_ready = time.perf_counter()
+        data_time += data_ready - step_start
+        profiler.start_step()
+        images, labels = batch_transform(images), labels.to(device, non_blocking=True)
+        targets = labels
+        if batch_transform.augment is not None:
+            # Mixup/cutmix give soft targets; accuracy still uses the hard labels
+            images, targets = batch_transform.augment.mix(images, labels)
         
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
+        with precision.autocast():
+            outputs = model(images)
+            loss = criterion(outputs, targets)
+        if loss_sampler is not None:
+            loss_sampler.record(step, F.cross_entropy(outputs.detach().float(), targets,
+                                                      reduction='none'))
+        profiler.mark()
+        precision.scaler.scale(loss).backward()
+        profiler.mark()
+        precision.scaler.step(optimizer)
+        precision.scaler.update()
+        optimizer.zero_grad(set_to_none=True)
+        profiler.end_step()
         
-        running_loss += loss.item()
-        _, predicted = outputs.max(1)
+        running_loss += loss.detach().float()
+        correct += outputs.argmax(1).eq(labels).sum()
         total += labels.size(0)
-        correct += predicted.eq(labels).sum().item()
+        log_images += labels.size(0)
         
-        pbar.set_postfix({'loss': running_loss/len(dataloader), 'acc': 100.*correct/total})
+        steps_done = step - start_step
+        if steps_done % log_every == 0 and is_main_process():
+            profiler.flush()
+            now = time.perf_counter()
+            pbar.set_postfix({'loss': running_loss.item() / steps_done,
+                              'acc': 100. * correct.item() / total,
+                              'img/s': log_images / (now - log_start)})
+            log_start, log_images = now, 0
+        if on_step is not None:
+            on_step(step)
+        
+        step_start = time.perf_counter()
+        compute_time += step_start - data_ready
     
-    epoch_loss = running_loss / len(dataloader)
-    epoch_acc = 100. * correct / total
-    return epoch_loss, epoch_acc
+    profiler.flush()
+    # Per-rank throughput, summed across ranks into the global figure
+    throughput = total / max(data_time + compute_time, 1e-9)
+    running_loss, num_batches, correct, total, throughput = reduce_sums(
+        running_loss.item(), len(dataloader), correct.item(), total, throughput)
+    epoch_loss = running_loss / max(num_batches, 1)
+    epoch_acc = 100. * correct / max(total, 1)
+    timing = {
+        'data_time': data_time,
+        'compute_time': compute_time,
+        'forward_time': profiler.totals['forward'],
+        'backward_time': profiler.totals['backward'],
+        'optimizer_time': profiler.totals['optimizer'],
+        'peak_memory_mb': profiler.peak_memory_mb(),
+        'throughput': throughput
+    }
+    return epoch_loss, epoch_acc, timing
 
-def validate(model, dataloader, criterion, device):
+def validate(model, dataloader, criterion, device, batch_transform=None, precision=None):
     """Validate the model"""
     model.eval()
+    batch_transform = batch_transform or BatchTransform(device)
+    precision = precision or FP32
     running_loss = 0.0
     correct = 0
     total = 0
     
     with torch.no_grad():
-        for images, labels in tqdm(dataloader, desc='Validation'):
-            images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
-            loss = criterion(outputs, labels)
+        for images, labels in tqdm(dataloader, desc='Validation', disable=not is_main_process()):
+            images, labels = batch_transform(images), labels.to(device)
+            with precision.autocast():
+                outputs = model(images)
+                loss = criterion(outputs, labels)
             
             running_loss += loss.item()
             _, predicted = outputs.max(1)
             total += labels.size(0)
             correct += predicted.eq(labels).sum().item()
     
-    epoch_loss = running_loss / len(dataloader)
+    running_loss, num_batches, correct, total = reduce_sums(running_loss, len(dataloader), correct, total)
+    epoch_loss = running_loss / num_batches
     epoch_acc = 100. * correct / total
     return epoch_loss, epoch_acc
 
+def resolution_for_epoch(epoch):
+    """Training resolution from CONFIG['resolution_schedule'] (None = full size)"""
+    for until_epoch, size in CONFIG['resolution_schedule']:
+        if epoch < until_epoch:
+            return size
+    return None
+
+class EarlyStopping:
+    """Stop when validation loss hasn't improved by min_delta for `patience` epochs"""
+    def __init__(self, patience, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = float('inf')
+        self.bad_epochs = 0
+    
+    def step(self, val_loss):
+        """Record an epoch; returns True when training should stop"""
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.bad_epochs = 0
+        else:
+            self.bad_epochs += 1
+        return self.patience > 0 and self.bad_epochs >= self.patience
+    
+    def state_dict(self):
+        return {'best_loss': self.best_loss, 'bad_epochs': self.bad_epochs}
+    
+    def load_state_dict(self, state):
+        self.best_loss = state['best_loss']
+        self.bad_epochs = state['bad_epochs']
+
+def record_scaling(world_size, throughput):
+    """Store this run's throughput and report efficiency against a 1-process run"""
+    path = Path(CONFIG['scaling_report_path'])
+    report = json.loads(path.read_text()) if path.exists() else {}
+    report[str(world_size)] = throughput
+    path.write_text(json.dumps(report, indent=2))
+    
+    print(f"Throughput with {world_size} process(es): {throughput:.1f} img/s")
+    if world_size > 1 and '1' in report:
+        efficiency = throughput / (world_size * report['1'])
+        print(f"Scaling efficiency vs 1 process: {100 * efficiency:.0f}%")
+    elif world_size > 1:
+        print("Run once without torchrun to record the 1-process baseline")
+
+def record_data_budget(history):
+    """Store this run's accuracy-vs-time curve and compare it with full-epoch training"""
+    path = Path(CONFIG['data_budget_report_path'])
+    report = json.loads(path.read_text()) if path.exists() else {}
+    budget = str(float(CONFIG['data_budget']))
+    report[budget] = {'elapsed_min': [t / 60 for t in history['elapsed']], 'val_acc': history['val_acc']}
+    path.write_text(json.dumps(report, indent=2))
+    
+    def best_acc_by(run, minutes):
+        accs = [acc for t, acc in zip(run['elapsed_min'], run['val_acc']) if t <= minutes]
+        return max(accs, default=0.0)
+    
+    def time_to_target(run):
+        return next((t for t, acc in zip(run['elapsed_min'], run['val_acc'])
+                     if acc >= CONFIG['target_val_acc']), None)
+    
+    run = report[budget]
+    minutes = run['elapsed_min'][-1] if run['elapsed_min'] else 0.0
+    print(f"Data budget {budget}: {best_acc_by(run, minutes):.2f}% val acc in {minutes:.1f} min "
+          f"({best_acc_by(run, minutes) / max(minutes, 1e-9):.2f} %/min)")
+    if budget != '1.0' and '1.0' in report:
+        full = report['1.0']
+        print(f"Full epochs at the same wall-clock time: {best_acc_by(full, minutes):.2f}% val acc")
+        ours, theirs = time_to_target(run), time_to_target(full)
+        if ours is not None and theirs is not None:
+            print(f"Time to {CONFIG['target_val_acc']:.1f}%: {ours:.1f} min vs {theirs:.1f} min "
+                  f"with full epochs ({theirs / max(ours, 1e-9):.2f}x)")
+    elif budget != '1.0':
+        print("Run once with CONFIG['data_budget'] = 1.0 to record the full-epoch baseline")
+
 def plot_training_history(history):
     """Plot training history"""
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
@@ -224,110 +711,106 @@ def plot_training_history(history):
     plt.savefig('training_history.png', dpi=300, bbox_inches='tight')
     print("Training history saved to 'training_history.png'")
 
-def evaluate_model(model, dataloader, label_encoder, device):
-    """Evaluate model on test set"""
-    print("\nEvaluating model on test set...")
-    
-    model.eval()
-    all_preds = []
-    all_labels = []
+def evaluate_model(model, dataloader, label_encoder, device, batch_transform=None, precision=None):
+    """Evaluate model on test set
     
-    with torch.no_grad():
-        for images, labels in tqdm(dataloader, desc='Testing'):
-            images = images.to(device)
-            outputs = model(images)
-            _, predicted = outputs.max(1)
-            
-            all_preds.extend(predicted.cpu().numpy())
-            all_labels.extend(labels.numpy())
-    
-    all_preds = np.array(all_preds)
-    all_labels = np.array(all_labels)
+    Metrics come from a confusion matrix accumulated on the device (see
+    evaluation.py); the heatmap is rendered on a background thread.
+    """
+    print("\nEvaluating model on test set...")
     
-    # Classification report
+    batch_transform = batch_transform or BatchTransform(device)
     class_names = label_encoder.classes_
-    report = classification_report(all_labels, all_preds, target_names=class_names, digits=4)
-    print("\nClassification Report:")
-    print(report)
-    
-    # Save report
-    with open('classification_report.txt', 'w') as f:
-        f.write(report)
-    
-    # Confusion matrix
-    cm = confusion_matrix(all_labels, all_preds)
-    
-    # Plot confusion matrix
-    plt.figure(figsize=(20, 18))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
-                xticklabels=class_names, yticklabels=class_names)
-    plt.title('Confusion Matrix')
-    plt.ylabel('True Label')
-    plt.xlabel('Predicted Label')
-    plt.xticks(rotation=90)
-    plt.yticks(rotation=0)
-    plt.tight_layout()
-    plt.savefig('confusion_matrix.png', dpi=300, bbox_inches='tight')
-    print("Confusion matrix saved to 'confusion_matrix.png'")
-    
-    # Calculate metrics
-    test_acc = accuracy_score(all_labels, all_preds)
-    test_precision = precision_score(all_labels, all_preds, average='weighted')
-    test_recall = recall_score(all_labels, all_preds, average='weighted')
-    test_f1 = f1_score(all_labels, all_preds, average='weighted')
-    
-    metrics = {
-        'test_accuracy': float(test_acc),
-        'test_precision': float(test_precision),
-        'test_recall': float(test_recall),
-        'test_f1_score': float(test_f1)
-    }
+    cm = evaluate(model, dataloader, len(class_names), device, batch_transform, precision)
+    metrics, _ = save_report(cm, class_names, plot=CONFIG['plot_confusion_matrix'],
+                             dpi=CONFIG['confusion_matrix_dpi'])
+    return metrics
+
+def prepare_data():
+    """Load the dataset, encode labels and split sample indices"""
+    # Load dataset (decoded once into a memory-mapped cache, reused on later runs)
+    images, labels, class_names = load_dataset(CONFIG['dataset_path'])
     
-    print("\nTest Metrics:")
-    for key, value in metrics.items():
-        print(f"{key}: {value:.4f}")
+    # Preprocess
+    images, labels_encoded, label_encoder = preprocess_data(images, labels, class_names)
     
-    # Save metrics
-    with open('test_metrics.json', 'w') as f:
-        json.dump(metrics, f, indent=2)
+    # Create splits (on sample indices, so no image data is copied)
+    train_idx, val_idx, test_idx, _, _, _ = create_data_splits(
+        np.arange(len(images)), labels_encoded)
     
-    return metrics
+    return images, labels_encoded, label_encoder, class_names, (train_idx, val_idx, test_idx)
 
-def main():
-    """Main training pipeline"""
+def main(resume=None):
+    """Main training pipeline
+    
+    `resume` is a checkpoint path (or 'latest') to continue an interrupted run.
+    Launched via torchrun, each process trains one shard with DistributedDataParallel.
+    """
     print("=" * 60)
     print("EfficientNet Plant Disease Detection - Training Pipeline")
     print("=" * 60)
     
+    # Join the process group if launched with torchrun
+    rank, world_size = setup_distributed()
+    
     # Check device
     device = torch.device(CONFIG['device'])
-    print(f"\nUsing device: {device}")
+    if device.type == 'cuda' and world_size > 1:
+        device = torch.device('cuda', torch.cuda.current_device())
+    print(f"\nUsing device: {device} (rank {rank} of {world_size})")
     
-    # Load dataset
-    images, labels, class_names = load_dataset(CONFIG['dataset_path'])
-    
-    # Preprocess
-    images, labels_encoded, label_encoder = preprocess_data(images, labels, class_names)
-    
-    # Create splits
-    X_train, X_val, X_test, y_train, y_val, y_test = create_data_splits(images, labels_encoded)
+    # Load dataset, encode labels and split
+    images, labels_encoded, label_encoder, class_names, splits = prepare_data()
+    train_idx, val_idx, test_idx = splits
     
     # Create datasets
-    train_dataset = PlantDiseaseDataset(X_train, y_train)
-    val_dataset = PlantDiseaseDataset(X_val, y_val)
-    test_dataset = PlantDiseaseDataset(X_test, y_test)
+    train_dataset = PlantDiseaseDataset(images, labels_encoded, indices=train_idx)
+    val_dataset = PlantDiseaseDataset(images, labels_encoded, indices=val_idx)
+    test_dataset = PlantDiseaseDataset(images, labels_encoded, indices=test_idx)
     
     # Create dataloaders
+    loader_settings = get_loader_settings()
+    print(f"DataLoader: {loader_settings}")
+    if CONFIG['data_budget'] < 1.0:
+        train_sampler = LossWeightedSampler(len(train_dataset), CONFIG['batch_size'], CONFIG['random_seed'],
+                                            device, CONFIG['data_budget'], CONFIG['prune_warmup_epochs'],
+                                            CONFIG['prune_loss_ema'], CONFIG['prune_min_weight'],
+                                            rank, world_size)
+        print(f"Data pruning: {CONFIG['data_budget']:.0%} of training samples per epoch "
+              f"after {CONFIG['prune_warmup_epochs']} full epoch(s)")
+    else:
+        train_sampler = ResumableSampler(len(train_dataset), CONFIG['batch_size'], CONFIG['random_seed'],
+                                         rank, world_size)
+    loss_sampler = train_sampler if isinstance(train_sampler, LossWeightedSampler) else None
+    val_sampler = DistributedSampler(val_dataset, shuffle=False) if world_size > 1 else None
     train_loader = DataLoader(train_dataset, batch_size=CONFIG['batch_size'], 
-                             shuffle=True, num_workers=CONFIG['num_workers'])
+                             sampler=train_sampler, **loader_settings)
     val_loader = DataLoader(val_dataset, batch_size=CONFIG['batch_size'], 
-                           shuffle=False, num_workers=CONFIG['num_workers'])
+                           sampler=val_sampler, shuffle=False, **loader_settings)
     test_loader = DataLoader(test_dataset, batch_size=CONFIG['batch_size'], 
-                            shuffle=False, num_workers=CONFIG['num_workers'])
+                            shuffle=False, **loader_settings)
+    
+    # On CPU, split the cores between ranks and leave the loader workers' cores free
+    if device.type == 'cpu' and (loader_settings['num_workers'] > 0 or world_size > 1):
+        local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+        cores = (os.cpu_count() or 1) // local_world_size
+        torch.set_num_threads(max(1, cores - loader_settings['num_workers']))
+        print(f"Torch threads: {torch.get_num_threads()}")
     
     # Create model
     model = create_model(num_classes=len(class_names))
     model = model.to(device)
+    if CONFIG['channels_last']:
+        model = model.to(memory_format=torch.channels_last)
+    # Ranks share the shuffle order but draw different augmentations
+    augment = BatchAugment(len(class_names), seed=CONFIG['random_seed'] + rank) if CONFIG['augment'] else None
+    train_transform = BatchTransform(device, CONFIG['channels_last'], augment=augment)
+    batch_transform = BatchTransform(device, CONFIG['channels_last'])
+    precision = PrecisionMode(CONFIG['precision'], device)
+    print(f"Precision: {precision.mode}, channels_last: {CONFIG['channels_last']}")
+    
+    # Gradients are all-reduced across ranks; `model` stays the plain module for saving
+    train_net = DistributedDataParallel(model) if world_size > 1 else model
     
     # Loss and optimizer
     criterion = nn.CrossEntropyLoss()
@@ -344,19 +827,101 @@ def main():
         'train_loss': [],
         'train_acc': [],
         'val_loss': [],
-        'val_acc': []
+        'val_acc': [],
+        'data_time': [],
+        'compute_time': [],
+        'throughput': [],
+        'forward_time': [],
+        'backward_time': [],
+        'optimizer_time': [],
+        'peak_memory_mb': [],
+        'val_acc_fp32': [],
+        'resolution': [],
+        'elapsed': []
     }
     
     best_val_acc = 0.0
+    start_epoch, start_step = 0, 0
+    early_stopping = EarlyStopping(CONFIG['early_stopping_patience'], CONFIG['early_stopping_min_delta'])
+    checkpointer = (AsyncCheckpointer(CONFIG['checkpoint_dir'], keep=CONFIG['checkpoint_keep'])
+                    if is_main_process() else None)
     
-    for epoch in range(CONFIG['epochs']):
-        print(f"\nEpoch {epoch+1}/{CONFIG['epochs']}")
+    def training_state(epoch, step):
+        return {
+            'epoch': epoch,
+            'step': step,
+            'model_state_dict': model.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'scheduler_state_dict': scheduler.state_dict(),
+            'scaler_state_dict': precision.scaler.state_dict(),
+            'history': history,
+            'best_val_acc': best_val_acc,
+            'early_stopping': early_stopping.state_dict(),
+            'loss_sampler': loss_sampler.state_dict() if loss_sampler is not None else None,
+            'rng_state': capture_rng_state(augment),
+            'num_classes': len(class_names)
+        }
+    
+    # Resume from a full-state checkpoint
+    if resume:
+        resume_path = latest_checkpoint(CONFIG['checkpoint_dir']) if resume == 'latest' else resume
+        if resume_path is None:
+            print("No checkpoint found, starting from scratch")
+        else:
+            state = torch.load(resume_path, map_location=device, weights_only=False)
+            model.load_state_dict(state['model_state_dict'])
+            optimizer.load_state_dict(state['optimizer_state_dict'])
+            scheduler.load_state_dict(state['scheduler_state_dict'])
+            precision.scaler.load_state_dict(state['scaler_state_dict'])
+            history.update(state['history'])
+            best_val_acc = state['best_val_acc']
+            early_stopping.load_state_dict(state['early_stopping'])
+            if loss_sampler is not None and state.get('loss_sampler') is not None:
+                loss_sampler.load_state_dict(state['loss_sampler'])
+            restore_rng_state(state['rng_state'], augment)
+            start_epoch, start_step = state['epoch'], state['step']
+            if rank > 0:
+                # The checkpoint holds rank 0's RNG and partial epoch losses only;
+                # rank 0 keeps those sums so the epoch's all-reduce counts them once
+                reseed_rank(rank, start_epoch, start_step, augment)
+                if loss_sampler is not None:
+                    loss_sampler.clear_epoch()
+            print(f"✓ Resumed from {resume_path} (epoch {start_epoch+1}, step {start_step})")
+    
+    # Phase timing across epochs; traces CONFIG['profile_steps'] (only on rank 0)
+    profiler = StepProfiler(device, CONFIG['profile_steps'] if is_main_process() else None,
+                            CONFIG['profile_dir'])
+    
+    # Wall-clock time carries over when resuming
+    train_start = time.time() - (history['elapsed'][-1] if history['elapsed'] else 0.0)
+    
+    for epoch in range(start_epoch, CONFIG['epochs']):
+        # Progressive resizing: early epochs train at lower resolution
+        train_transform.resolution = resolution_for_epoch(epoch)
+        resolution = train_transform.resolution or CONFIG['image_size'][0]
+        print(f"\nEpoch {epoch+1}/{CONFIG['epochs']} ({resolution}px)")
+        epoch_start_step = start_step if epoch == start_epoch else 0
+        train_sampler.set_epoch(epoch, epoch_start_step)
+        if val_sampler is not None:
+            val_sampler.set_epoch(epoch)
+        
+        def checkpoint_step(step, epoch=epoch):
+            if checkpointer is not None and step % CONFIG['checkpoint_every_steps'] == 0:
+                checkpointer.save(training_state(epoch, step), epoch, step)
         
         # Train
-        train_loss, train_acc = train_epoch(model, train_loader, criterion, optimizer, device)
+        train_loss, train_acc, timing = train_epoch(train_net, train_loader, criterion, optimizer, device,
+                                                    train_transform, precision,
+                                                    start_step=epoch_start_step, on_step=checkpoint_step,
+                                                    profiler=profiler, loss_sampler=loss_sampler)
+        if loss_sampler is not None:
+            loss_sampler.finish_epoch()
         
         # Validate
-        val_loss, val_acc = validate(model, val_loader, criterion, device)
+        val_loss, val_acc = validate(model, val_loader, criterion, device, batch_transform, precision)
+        val_acc_fp32 = val_acc
+        if precision.mode != 'fp32' and CONFIG['compare_fp32']:
+            _, val_acc_fp32 = validate(model, val_loader, criterion, device, batch_transform)
         
         # Update scheduler
         scheduler.step(val_loss)
@@ -366,9 +931,34 @@ def main():
         history['train_acc'].append(train_acc)
         history['val_loss'].append(val_loss)
         history['val_acc'].append(val_acc)
+        history['data_time'].append(timing['data_time'])
+        history['compute_time'].append(timing['compute_time'])
+        history['throughput'].append(timing['throughput'])
+        for key in ('forward_time', 'backward_time', 'optimizer_time', 'peak_memory_mb'):
+            history[key].append(timing[key])
+        history['val_acc_fp32'].append(val_acc_fp32)
+        history['resolution'].append(resolution)
+        history['elapsed'].append(time.time() - train_start)
+        
+        # Same reduced val loss on every rank, so all ranks stop together
+        stop = early_stopping.step(val_loss)
+        
+        if not is_main_process():
+            if stop:
+                break
+            continue
         
         print(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
         print(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+        wait_pct = 100. * timing['data_time'] / max(timing['data_time'] + timing['compute_time'], 1e-9)
+        print(f"Data wait: {timing['data_time']:.1f}s ({wait_pct:.0f}%), "
+              f"Compute: {timing['compute_time']:.1f}s, Throughput: {timing['throughput']:.1f} img/s")
+        peak = f"{timing['peak_memory_mb']:.0f} MB" if timing['peak_memory_mb'] is not None else "n/a"
+        print(f"Forward: {timing['forward_time']:.1f}s, Backward: {timing['backward_time']:.1f}s, "
+              f"Optimizer: {timing['optimizer_time']:.1f}s, Peak memory: {peak}")
+        if precision.mode != 'fp32' and CONFIG['compare_fp32']:
+            print(f"Val Acc {precision.mode}: {val_acc:.2f}% vs fp32: {val_acc_fp32:.2f}% "
+                  f"(diff {val_acc - val_acc_fp32:+.2f})")
         
         # Save best model
         if val_acc > best_val_acc:
@@ -378,9 +968,35 @@ def main():
                 'model_state_dict': model.state_dict(),
                 'optimizer_state_dict': optimizer.state_dict(),
                 'val_acc': val_acc,
-                'num_classes': len(class_names)
+                'num_classes': len(class_names),
+                'arch': CONFIG['model_arch']
             }, CONFIG['model_save_path'])
             print(f"✓ Best model saved! Val Acc: {val_acc:.2f}%")
+        
+        # Full-state checkpoint at the epoch boundary (written in the background)
+        checkpointer.save(training_state(epoch + 1, 0), epoch + 1, 0)
+        print(f"Checkpoint blocking time so far: {checkpointer.blocking_time:.2f}s "
+              f"over {checkpointer.saves} saves")
+        
+        if stop:
+            print(f"Early stopping: no val loss improvement for {early_stopping.patience} epochs")
+            break
+    
+    if not is_main_process():
+        dist.destroy_process_group()
+        return
+    checkpointer.close()
+    record_scaling(world_size, float(np.mean(history['throughput'])) if history['throughput'] else 0.0)
+    record_data_budget(history)
+    
+    # Wall-clock time to reach the target validation accuracy
+    reached = [i for i, acc in enumerate(history['val_acc']) if acc >= CONFIG['target_val_acc']]
+    if reached:
+        print(f"Reached {CONFIG['target_val_acc']:.1f}% val acc after "
+              f"{history['elapsed'][reached[0]] / 60:.1f} min (epoch {reached[0] + 1})")
+    else:
+        print(f"Target val acc {CONFIG['target_val_acc']:.1f}% not reached "
+              f"(best {max(history['val_acc'], default=0):.2f}%)")
     
     # Plot training history
     plot_training_history(history)
@@ -393,7 +1009,7 @@ def main():
     checkpoint = torch.load(CONFIG['model_save_path'])
     model.load_state_dict(checkpoint['model_state_dict'])
     
-    metrics = evaluate_model(model, test_loader, label_encoder, device)
+    metrics = evaluate_model(model, test_loader, label_encoder, device, batch_transform, precision)
     
     print("\n" + "=" * 60)
     print("Training Complete!")
@@ -403,6 +1019,596 @@ def main():
     print(f"Class names saved to: {CONFIG['class_names_path']}")
     print(f"Test Accuracy: {metrics['test_accuracy']:.4f}")
     print("=" * 60)
+    
+    if is_distributed():
+        dist.destroy_process_group()
+
+def load_backbone(num_classes):
+    """Model whose backbone comes from the current checkpoint (ImageNet weights if missing)"""
+    path = CONFIG['head_backbone_path']
+    if not Path(path).exists():
+        return create_model(num_classes)
+    
+    checkpoint = torch.load(path, map_location='cpu')
+    state_dict = checkpoint.get('model_state_dict', checkpoint)
+    model = timm.create_model(checkpoint.get('arch', CONFIG['model_arch']), pretrained=False,
+                              num_classes=num_classes)
+    # The classifier may have a different number of classes; it is retrained anyway
+    backbone_state = {k: v for k, v in state_dict.items() if not k.startswith('classifier.')}
+    model.load_state_dict(backbone_state, strict=False)
+    print(f"✓ Backbone loaded from {path}")
+    return model
+
+def weights_fingerprint(model, include_head=True):
+    """Hash of the model weights (optionally only those outside the classifier head)"""
+    digest = hashlib.sha1()
+    for name, tensor in model.state_dict().items():
+        if include_head or not name.startswith('classifier.'):
+            digest.update(name.encode())
+            digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+def dataset_fingerprint(images):
+    """Hash identifying which images (in which order) an image source holds"""
+    digest = hashlib.sha1(str(tuple(images.image_size)).encode())
+    if hasattr(images, 'locations'):
+        digest.update(json.dumps(images.shard_files).encode())
+        digest.update(images.locations.tobytes())
+    else:
+        digest.update('\n'.join(images.paths).encode())
+    return digest.hexdigest()
+
+def cache_model_outputs(cache_dir, key, width, images, labels, batch_transform, precision,
+                        forward, desc):
+    """Run `forward` once over every sample and cache its float32 outputs
+    
+    Reused across runs while `key` (model and dataset fingerprint) is unchanged.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    outputs_path = cache_dir / 'outputs.npy'
+    meta_path = cache_dir / 'meta.json'
+    
+    if meta_path.exists() and outputs_path.exists():
+        with open(meta_path, 'r') as f:
+            if json.load(f)['key'] == key:
+                print(f"✓ Reusing cached {desc} from {outputs_path}")
+                return np.load(outputs_path, mmap_mode='r')
+        meta_path.unlink()
+    
+    print(f"Computing {desc} (one pass over the dataset)...")
+    loader = DataLoader(PlantDiseaseDataset(images, labels), batch_size=CONFIG['batch_size'],
+                        shuffle=False, **get_loader_settings())
+    outputs = np.lib.format.open_memmap(outputs_path, mode='w+', dtype=np.float32,
+                                        shape=(len(images), width))
+    position = 0
+    with torch.no_grad():
+        for batch, _ in tqdm(loader, desc=desc.capitalize()):
+            with precision.autocast():
+                result = forward(batch_transform(batch))
+            outputs[position:position + len(result)] = result.float().cpu().numpy()
+            position += len(result)
+    outputs.flush()
+    del outputs
+    
+    # Written last, so an interrupted pass is never mistaken for a valid cache
+    with open(meta_path, 'w') as f:
+        json.dump({'key': key, 'num_samples': len(images), 'width': width}, f)
+    print(f"✓ Cached {desc} for {len(images)} samples to {outputs_path}")
+    return np.load(outputs_path, mmap_mode='r')
+
+def build_feature_cache(model, images, labels, device, batch_transform, precision):
+    """Pooled features of the frozen backbone for every sample (cached on disk)"""
+    key = hashlib.sha1((weights_fingerprint(model, include_head=False) +
+                        dataset_fingerprint(images)).encode()).hexdigest()
+    model.eval()
+    # pre_logits width: differs from num_features when the head has its own
+    # conv (e.g. MobileNetV3's 576 -> 1024)
+    width = getattr(model, 'head_hidden_size', model.num_features)
+    return cache_model_outputs(
+        CONFIG['feature_cache_dir'], key, width, images, labels,
+        batch_transform, precision,
+        lambda batch: model.forward_head(model.forward_features(batch), pre_logits=True),
+        'backbone features')
+
+def train_head_only():
+    """Retrain only the classifier head on cached features from the frozen backbone"""
+    print("=" * 60)
+    print("EfficientNet Plant Disease Detection - Head-only Training")
+    print("=" * 60)
+    
+    device = torch.device(CONFIG['device'])
+    print(f"\nUsing device: {device}")
+    
+    images, labels_encoded, label_encoder, class_names, splits = prepare_data()
+    train_idx, val_idx, test_idx = splits
+    
+    # Frozen backbone
+    model = load_backbone(len(class_names)).to(device)
+    if CONFIG['channels_last']:
+        model = model.to(memory_format=torch.channels_last)
+    for param in model.parameters():
+        param.requires_grad_(False)
+    batch_transform = BatchTransform(device, CONFIG['channels_last'])
+    precision = PrecisionMode(CONFIG['precision'], device)
+    features = build_feature_cache(model, images, labels_encoded, device, batch_transform, precision)
+    
+    # Train the head on feature vectors (BatchTransform just moves float batches to the device)
+    head = model.get_classifier()
+    for param in head.parameters():
+        param.requires_grad_(True)
+    feature_transform = BatchTransform(device)
+    
+    def feature_loader(indices, shuffle):
+        dataset = PlantDiseaseDataset(features, labels_encoded, transform=torch.from_numpy,
+                                      indices=indices)
+        return DataLoader(dataset, batch_size=CONFIG['head_batch_size'], shuffle=shuffle)
+    
+    train_loader = feature_loader(train_idx, shuffle=True)
+    val_loader = feature_loader(val_idx, shuffle=False)
+    test_loader = feature_loader(test_idx, shuffle=False)
+    
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(head.parameters(), lr=CONFIG['head_learning_rate'])
+    best_val_acc = 0.0
+    
+    for epoch in range(CONFIG['head_epochs']):
+        print(f"\nEpoch {epoch+1}/{CONFIG['head_epochs']}")
+        train_loss, train_acc, timing = train_epoch(head, train_loader, criterion, optimizer,
+                                                    device, feature_transform)
+        val_loss, val_acc = validate(head, val_loader, criterion, device, feature_transform)
+        print(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+        print(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}% "
+              f"({timing['data_time'] + timing['compute_time']:.1f}s)")
+        
+        # Save the full model (frozen backbone + head) in the format api_service.py loads
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            torch.save({
+                'epoch': epoch,
+                'model_state_dict': model.state_dict(),
+                'val_acc': val_acc,
+                'num_classes': len(class_names),
+                'arch': CONFIG['model_arch'],
+                'mode': 'head-only'
+            }, CONFIG['model_save_path'])
+            print(f"✓ Best model saved! Val Acc: {val_acc:.2f}%")
+    
+    checkpoint = torch.load(CONFIG['model_save_path'])
+    model.load_state_dict(checkpoint['model_state_dict'])
+    metrics = evaluate_model(head, test_loader, label_encoder, device, feature_transform)
+    
+    print("\n" + "=" * 60)
+    print("Head-only Training Complete!")
+    print("=" * 60)
+    print(f"Model saved to: {CONFIG['model_save_path']}")
+    print(f"Test Accuracy: {metrics['test_accuracy']:.4f}")
+    print("=" * 60)
+
+def load_trained_model(path, num_classes, device):
+    """Trained model from a checkpoint and its architecture"""
+    checkpoint = torch.load(path, map_location='cpu')
+    arch = checkpoint.get('arch', CONFIG['model_arch'])
+    model = timm.create_model(arch, pretrained=False, num_classes=num_classes)
+    model.load_state_dict(checkpoint.get('model_state_dict', checkpoint))
+    print(f"✓ {arch} loaded from {path}")
+    return model.to(device).eval(), arch
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature, alpha):
+    """KL divergence to the softened teacher distribution plus hard-label cross-entropy"""
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                    F.softmax(teacher_logits / temperature, dim=1),
+                    reduction='batchmean') * temperature ** 2
+    return alpha * soft + (1 - alpha) * F.cross_entropy(student_logits, labels)
+
+def distill_epoch(student, dataloader, optimizer, device, batch_transform, precision,
+                  labels, teacher_logits):
+    """Train the student for one epoch against cached teacher logits
+    
+    The loader yields sample indices in place of labels; hard labels and
+    teacher logits are looked up from device tensors.
+    """
+    student.train()
+    running_loss = 0.0
+    correct = 0
+    total = 0
+    
+    pbar = tqdm(dataloader, desc='Distilling')
+    for images, idx in pbar:
+        images, idx = batch_transform(images), idx.to(device)
+        targets = labels[idx]
+        
+        optimizer.zero_grad()
+        with precision.autocast():
+            outputs = student(images)
+        loss = distillation_loss(outputs.float(), teacher_logits[idx], targets,
+                                 CONFIG['distill_temperature'], CONFIG['distill_alpha'])
+        precision.scaler.scale(loss).backward()
+        precision.scaler.step(optimizer)
+        precision.scaler.update()
+        
+        running_loss += loss.item()
+        total += targets.size(0)
+        correct += outputs.argmax(1).eq(targets).sum().item()
+        pbar.set_postfix({'loss': running_loss/len(dataloader), 'acc': 100.*correct/total})
+    
+    return running_loss / len(dataloader), 100. * correct / total
+
+def measure_latency(model, batch_sizes, iterations=20):
+    """Median CPU latency (ms) of one forward pass per batch size"""
+    model = model.to('cpu').eval()
+    width, height = CONFIG['image_size']
+    latencies = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            dummy = torch.randn(batch_size, 3, height, width)
+            for _ in range(3):
+                model(dummy)
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                model(dummy)
+                timings.append((time.perf_counter() - start) * 1000)
+            latencies[str(batch_size)] = round(float(np.median(timings)), 2)
+    return latencies
+
+def train_distilled():
+    """Distill the trained teacher into a smaller, faster student for serving"""
+    print("=" * 60)
+    print("EfficientNet Plant Disease Detection - Distillation")
+    print("=" * 60)
+    
+    device = torch.device(CONFIG['device'])
+    print(f"\nUsing device: {device}")
+    
+    images, labels_encoded, label_encoder, class_names, splits = prepare_data()
+    train_idx, val_idx, test_idx = splits
+    num_classes = len(class_names)
+    batch_transform = BatchTransform(device, CONFIG['channels_last'])
+    precision = PrecisionMode(CONFIG['precision'], device)
+    
+    # Teacher soft targets on un-augmented images, computed once and cached until teacher or dataset change
+    teacher, teacher_arch = load_trained_model(CONFIG['distill_teacher_path'], num_classes, device)
+    key = hashlib.sha1((weights_fingerprint(teacher) + dataset_fingerprint(images)).encode()).hexdigest()
+    cached_logits = cache_model_outputs(CONFIG['distill_cache_dir'], key, num_classes, images,
+                                        labels_encoded, batch_transform, precision, teacher,
+                                        'teacher logits')
+    teacher_logits = torch.from_numpy(np.array(cached_logits)).to(device)
+    labels = torch.as_tensor(labels_encoded, device=device)
+    
+    # The train loader yields sample indices as "labels" (see distill_epoch)
+    loader_settings = get_loader_settings()
+    train_loader = DataLoader(PlantDiseaseDataset(images, np.arange(len(images)), indices=train_idx),
+                              batch_size=CONFIG['batch_size'], shuffle=True, **loader_settings)
+    val_loader = DataLoader(PlantDiseaseDataset(images, labels_encoded, indices=val_idx),
+                            batch_size=CONFIG['batch_size'], shuffle=False, **loader_settings)
+    test_loader = DataLoader(PlantDiseaseDataset(images, labels_encoded, indices=test_idx),
+                             batch_size=CONFIG['batch_size'], shuffle=False, **loader_settings)
+    
+    arch = CONFIG['distill_student_arch']
+    student = create_model(num_classes, arch).to(device)
+    if CONFIG['channels_last']:
+        student = student.to(memory_format=torch.channels_last)
+    optimizer = optim.Adam(student.parameters(), lr=CONFIG['learning_rate'])
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=CONFIG['distill_epochs'])
+    criterion = nn.CrossEntropyLoss()
+    early_stopping = EarlyStopping(CONFIG['early_stopping_patience'], CONFIG['early_stopping_min_delta'])
+    best_val_acc = 0.0
+    
+    for epoch in range(CONFIG['distill_epochs']):
+        print(f"\nEpoch {epoch+1}/{CONFIG['distill_epochs']}")
+        train_loss, train_acc = distill_epoch(student, train_loader, optimizer, device,
+                                              batch_transform, precision, labels, teacher_logits)
+        val_loss, val_acc = validate(student, val_loader, criterion, device, batch_transform, precision)
+        scheduler.step()
+        print(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+        print(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+        
+        # Same checkpoint format as the teacher, plus the architecture api_service.py builds
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            torch.save({
+                'epoch': epoch,
+                'model_state_dict': student.state_dict(),
+                'val_acc': val_acc,
+                'num_classes': num_classes,
+                'arch': arch,
+                'mode': 'distilled'
+            }, CONFIG['distill_save_path'])
+            print(f"✓ Best student saved! Val Acc: {val_acc:.2f}%")
+        
+        if early_stopping.step(val_loss):
+            print(f"Early stopping: no val loss improvement for {early_stopping.patience} epochs")
+            break
+    
+    # Compare teacher and student on the test split and CPU latency
+    student.load_state_dict(torch.load(CONFIG['distill_save_path'])['model_state_dict'])
+    report = {}
+    for name, net, net_arch in (('teacher', teacher, teacher_arch), ('student', student, arch)):
+        _, test_acc = validate(net, test_loader, criterion, device, batch_transform, precision)
+        report[name] = {
+            'arch': net_arch,
+            'params_m': round(sum(p.numel() for p in net.parameters()) / 1e6, 2),
+            'test_accuracy': round(test_acc / 100, 4),
+            'cpu_latency_ms': measure_latency(net, CONFIG['latency_batch_sizes'])
+        }
+    with open(CONFIG['distill_report_path'], 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print("\n" + "=" * 60)
+    print("Distillation Complete!")
+    print("=" * 60)
+    print(f"{'':<10}{'arch':<24}{'params (M)':>12}{'test acc':>10}")
+    for name, r in report.items():
+        print(f"{name:<10}{r['arch']:<24}{r['params_m']:>12}{r['test_accuracy']:>10.4f}")
+    print("CPU latency per batch (ms):")
+    for batch_size in report['teacher']['cpu_latency_ms']:
+        t, st = report['teacher']['cpu_latency_ms'][batch_size], report['student']['cpu_latency_ms'][batch_size]
+        print(f"  batch {batch_size:>3}: teacher {t:8.1f}  student {st:8.1f}  ({t / st:.1f}x faster)")
+    print(f"Student saved to: {CONFIG['distill_save_path']} (serve it via api_service.py model_path)")
+    print(f"Report saved to: {CONFIG['distill_report_path']}")
+    print("=" * 60)
+
+def compress_model():
+    """Prune to a FLOP budget and/or quantization-aware fine-tune the trained model
+    
+    Exports a TorchScript model for CPU serving and reports accuracy, FLOPs,
+    size and latency against the full model's test_metrics.json.
+    """
+    print("=" * 60)
+    print(f"EfficientNet Plant Disease Detection - Compression ({CONFIG['compression']})")
+    print("=" * 60)
+    
+    # Fake-quantized models train on CPU; pruning fine-tunes on the training device
+    device = torch.device(CONFIG['device'])
+    cpu = torch.device('cpu')
+    images, labels_encoded, label_encoder, class_names, splits = prepare_data()
+    train_idx, val_idx, test_idx = splits
+    
+    loader_settings = get_loader_settings()
+    train_loader = DataLoader(PlantDiseaseDataset(images, labels_encoded, indices=train_idx),
+                              batch_size=CONFIG['batch_size'], shuffle=True, **loader_settings)
+    val_loader = DataLoader(PlantDiseaseDataset(images, labels_encoded, indices=val_idx),
+                            batch_size=CONFIG['batch_size'], shuffle=False, **loader_settings)
+    test_loader = DataLoader(PlantDiseaseDataset(images, labels_encoded, indices=test_idx),
+                             batch_size=CONFIG['batch_size'], shuffle=False, **loader_settings)
+    criterion = nn.CrossEntropyLoss()
+    
+    def finetune(net, run_device, stage):
+        """Fine-tune for CONFIG['compress_epochs'] and keep the best validation epoch"""
+        transform = BatchTransform(run_device)
+        optimizer = optim.Adam(net.parameters(), lr=CONFIG['compress_learning_rate'])
+        best_val_acc, best_state = -1.0, None
+        for epoch in range(CONFIG['compress_epochs']):
+            print(f"\n{stage} epoch {epoch+1}/{CONFIG['compress_epochs']}")
+            train_loss, train_acc, _ = train_epoch(net, train_loader, criterion, optimizer,
+                                                   run_device, transform)
+            val_loss, val_acc = validate(net, val_loader, criterion, run_device, transform)
+            print(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+            print(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+            if val_acc > best_val_acc:
+                best_val_acc = val_acc
+                best_state = {k: v.detach().clone() for k, v in net.state_dict().items()}
+        net.load_state_dict(best_state)
+        return net
+    
+    baseline, arch = load_trained_model(CONFIG['model_save_path'], len(class_names), cpu)
+    model = copy.deepcopy(baseline)
+    report = {'compression': CONFIG['compression'], 'arch': arch}
+    
+    if 'prune' in CONFIG['compression']:
+        model, ratio, base_flops, pruned_flops = prune_to_budget(model, CONFIG['flop_budget'],
+                                                                 CONFIG['image_size'])
+        print(f"Pruned {ratio:.0%} of expansion channels: "
+              f"{base_flops / 1e9:.2f} -> {pruned_flops / 1e9:.2f} GMACs")
+        report.update(prune_ratio=round(ratio, 3), gmacs=round(pruned_flops / 1e9, 3),
+                      baseline_gmacs=round(base_flops / 1e9, 3))
+        model = finetune(model.to(device), device, 'Pruning fine-tune').to(cpu)
+    
+    if 'qat' in CONFIG['compression']:
+        model = finetune(prepare_qat(model, CONFIG['image_size']), cpu, 'QAT')
+        model = convert_qat(model)
+    
+    exported = export_torchscript(model, CONFIG['compressed_model_path'], CONFIG['image_size'])
+    _, test_acc = validate(exported, test_loader, criterion, cpu)
+    
+    # Baseline accuracy from the full model's evaluation
+    baseline_acc = None
+    if Path('test_metrics.json').exists():
+        with open('test_metrics.json', 'r') as f:
+            baseline_acc = json.load(f)['test_accuracy']
+    if baseline_acc is None:
+        _, baseline_acc = validate(baseline, test_loader, criterion, cpu)
+        baseline_acc /= 100
+    
+    report.update({
+        'baseline_test_accuracy': round(baseline_acc, 4),
+        'test_accuracy': round(test_acc / 100, 4),
+        'accuracy_drop': round(baseline_acc - test_acc / 100, 4),
+        'baseline_size_mb': round(Path(CONFIG['model_save_path']).stat().st_size / 2**20, 1),
+        'size_mb': round(Path(CONFIG['compressed_model_path']).stat().st_size / 2**20, 1),
+        'baseline_cpu_latency_ms': measure_latency(baseline, CONFIG['latency_batch_sizes']),
+        'cpu_latency_ms': measure_latency(exported, CONFIG['latency_batch_sizes'])
+    })
+    with open(CONFIG['compression_report_path'], 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print("\n" + "=" * 60)
+    print("Compression Complete!")
+    print("=" * 60)
+    print(f"Test accuracy: {report['baseline_test_accuracy']:.4f} -> {report['test_accuracy']:.4f} "
+          f"({-report['accuracy_drop']:+.4f})")
+    print(f"Size: {report['baseline_size_mb']} MB -> {report['size_mb']} MB")
+    print("CPU latency per batch (ms):")
+    for batch_size, base in report['baseline_cpu_latency_ms'].items():
+        compressed = report['cpu_latency_ms'][batch_size]
+        print(f"  batch {batch_size:>3}: {base:8.1f} -> {compressed:8.1f}  ({base / compressed:.1f}x faster)")
+    print(f"Model exported to: {CONFIG['compressed_model_path']}")
+    print(f"Report saved to: {CONFIG['compression_report_path']}")
+    print("=" * 60)
+
+def incremental_update(new_data_path):
+    """Fine-tune the current model on newly confirmed images plus a replay buffer
+    
+    Writes a new versioned checkpoint to CONFIG['model_versions_dir']; the
+    deployed model is left untouched (hot-swap it via POST /admin/reload).
+    """
+    print("=" * 60)
+    print("EfficientNet Plant Disease Detection - Incremental Update")
+    print("=" * 60)
+    
+    device = torch.device(CONFIG['device'])
+    print(f"\nUsing device: {device}")
+    images, labels_encoded, label_encoder, class_names, splits = prepare_data()
+    train_idx, val_idx, _ = splits
+    class_to_idx = {name: i for i, name in enumerate(class_names)}
+    position = {path: i for i, path in enumerate(images.paths)}
+    
+    # Uploads already used by the parent version (trained on or held out), by content hash
+    parent_path = CONFIG['model_save_path']
+    parent = torch.load(parent_path, map_location='cpu')
+    parent_version = parent.get('version', 0)
+    trained_uploads = set(parent.get('trained_uploads', []))
+    held_out_uploads = set(parent.get('held_out_uploads', []))
+    del parent
+    
+    # New labelled images (classes must already exist in the model); only files
+    # no earlier version has seen are trained on or held out
+    new_files = ImageFiles(new_data_path, CONFIG['image_size'])
+    unknown = sorted(set(new_files.class_names) - set(class_to_idx))
+    if unknown:
+        raise ValueError(f"New classes {unknown} need a full or head-only retrain")
+    new_labels = np.array([class_to_idx[new_files.class_names[i]] for i in new_files.labels], dtype=np.int64)
+    hashes = [hashlib.sha1(Path(path).read_bytes()).hexdigest() for path in new_files.paths]
+    fresh = np.array([i for i, sha1 in enumerate(hashes)
+                      if sha1 not in trained_uploads and sha1 not in held_out_uploads], dtype=np.int64)
+    print(f"New images: {len(fresh)} unseen of {len(new_files)} in {new_data_path}")
+    if len(fresh) == 0:
+        print("Nothing new to train on since the last update")
+        return
+    order = np.random.default_rng(CONFIG['random_seed']).permutation(fresh)
+    num_val = int(len(order) * CONFIG['incremental_val_split'])
+    new_val_idx, new_train_idx = order[:num_val], order[num_val:]
+    print(f"Unseen images: {len(new_train_idx)} train, {len(new_val_idx)} held out")
+    
+    # Replay buffer: reservoir sample of the original training data, kept across updates
+    buffer = ReplayBuffer.load(CONFIG['replay_buffer_path'])
+    if buffer is None:
+        buffer = ReplayBuffer(CONFIG['replay_buffer_size'], CONFIG['random_seed'])
+        buffer.add((images.paths[i], class_names[labels_encoded[i]]) for i in train_idx)
+    # Items from earlier updates (confirmed uploads) aren't in the cache; read them from disk
+    replay_idx = np.array([position[path] for path, _ in buffer.items if path in position], dtype=np.int64)
+    uploaded = [(path, name) for path, name in buffer.items
+                if path not in position and name in class_to_idx and Path(path).exists()]
+    replay_files = ImageFiles.from_files(uploaded, CONFIG['image_size'])
+    replay_labels = np.array([class_to_idx[name] for _, name in uploaded], dtype=np.int64)
+    missing = len(buffer) - len(replay_idx) - len(uploaded)
+    print(f"Replay buffer: {len(replay_idx) + len(uploaded)} images ({len(replay_idx)} cached, "
+          f"{len(uploaded)} from earlier uploads; sampled from {buffer.seen} seen)")
+    if missing:
+        print(f"Warning: {missing} replay images no longer exist on disk and are skipped")
+    
+    # Mixed training set; held-out new images plus a slice of the original validation split
+    loader_settings = get_loader_settings()
+    train_loader = DataLoader(ConcatDataset([
+        PlantDiseaseDataset(new_files, new_labels, indices=new_train_idx),
+        PlantDiseaseDataset(images, labels_encoded, indices=replay_idx),
+        PlantDiseaseDataset(replay_files, replay_labels)
+    ]), batch_size=CONFIG['batch_size'], shuffle=True, **loader_settings)
+    val_sets = {
+        'original': DataLoader(PlantDiseaseDataset(images, labels_encoded,
+                                                   indices=val_idx[:CONFIG['incremental_val_samples']]),
+                               batch_size=CONFIG['batch_size'], shuffle=False, **loader_settings)
+    }
+    if num_val:
+        val_sets['new'] = DataLoader(PlantDiseaseDataset(new_files, new_labels, indices=new_val_idx),
+                                     batch_size=CONFIG['batch_size'], shuffle=False, **loader_settings)
+    
+    model, arch = load_trained_model(parent_path, len(class_names), device)
+    augment = BatchAugment(len(class_names), seed=CONFIG['random_seed']) if CONFIG['augment'] else None
+    train_transform = BatchTransform(device, CONFIG['channels_last'], augment=augment)
+    batch_transform = BatchTransform(device, CONFIG['channels_last'])
+    precision = PrecisionMode(CONFIG['precision'], device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=CONFIG['incremental_learning_rate'])
+    
+    def validate_all():
+        return {name: validate(model, loader, criterion, device, batch_transform, precision)[1]
+                for name, loader in val_sets.items()}
+    
+    before = validate_all()
+    start = time.time()
+    for epoch in range(CONFIG['incremental_epochs']):
+        print(f"\nEpoch {epoch+1}/{CONFIG['incremental_epochs']}")
+        train_loss, train_acc, _ = train_epoch(model, train_loader, criterion, optimizer, device,
+                                               train_transform, precision)
+        print(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+    after = validate_all()
+    
+    # Next free version number (the parent's, or a later one already written)
+    versions_dir = Path(CONFIG['model_versions_dir'])
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    existing = [int(p.stem.rsplit('_v', 1)[1]) for p in versions_dir.glob(f"{Path(parent_path).stem}_v*.pth")
+                if p.stem.rsplit('_v', 1)[1].isdigit()]
+    version = max([parent_version] + existing) + 1
+    save_path = versions_dir / f"{Path(parent_path).stem}_v{version:03d}.pth"
+    torch.save({
+        'model_state_dict': model.state_dict(),
+        'val_acc': after['original'],
+        'num_classes': len(class_names),
+        'arch': arch,
+        'mode': 'incremental',
+        'version': version,
+        'parent': str(parent_path),
+        'new_images': len(fresh),
+        # Cumulative upload hashes, so the next update only uses files added since
+        'trained_uploads': sorted(trained_uploads | {hashes[i] for i in new_train_idx}),
+        'held_out_uploads': sorted(held_out_uploads | {hashes[i] for i in new_val_idx}),
+        'val_acc_before': before,
+        'val_acc_after': after
+    }, save_path)
+    
+    # New training images join the reservoir for future updates
+    buffer.add((new_files.paths[i], new_files.class_names[new_files.labels[i]]) for i in new_train_idx)
+    buffer.save(CONFIG['replay_buffer_path'])
+    
+    print("\n" + "=" * 60)
+    print(f"Incremental Update Complete! ({(time.time() - start) / 60:.1f} min of training)")
+    print("=" * 60)
+    for name in after:
+        print(f"Val Acc ({name} images): {before[name]:.2f}% -> {after[name]:.2f}% "
+              f"({after[name] - before[name]:+.2f})")
+    print(f"Checkpoint v{version} saved to: {save_path}")
+    print(f"Deploy with: POST /admin/reload {{\"model_path\": \"{save_path.as_posix()}\"}}")
+    print("=" * 60)
+
+def parse_args():
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Train the plant disease classifier")
+    parser.add_argument('--mode', choices=['full', 'head-only', 'distill', 'compress', 'incremental'],
+                        default='full',
+                        help="'head-only' retrains just the classifier on cached backbone features; "
+                             "'distill' trains a small student on cached teacher soft targets; "
+                             "'compress' prunes and/or quantizes the trained model; "
+                             "'incremental' fine-tunes on new confirmed images with a replay buffer")
+    parser.add_argument('--new-data', default=CONFIG['confirmed_uploads_path'],
+                        help="Class-per-folder directory of new images for --mode incremental")
+    parser.add_argument('--resume', nargs='?', const='latest', default=None,
+                        help="Resume from a checkpoint path (default: latest in CONFIG['checkpoint_dir'])")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.mode == 'head-only':
+        train_head_only()
+    elif args.mode == 'distill':
+        train_distilled()
+    elif args.mode == 'compress':
+        compress_model()
+    elif args.mode == 'incremental':
+        incremental_update(args.new_data)
+    else:
+        main(resume=args.resume)
+        # Only one process compresses after a torchrun launch
+        if CONFIG['compress_after_training'] and int(os.environ.get('RANK', 0)) == 0:
+            compress_model()